@@ -0,0 +1,108 @@
+"""Сравнение чтения анкеты ORM-объектом (selectinload + refresh) и карточкой ProfileCard.
+
+Считает SQL-запросы и память (tracemalloc) на одну прочитанную анкету для обоих способов.
+Запуск из корня репозитория: python benchmarks/bench_cards.py [--profiles 2000] [--reads 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Отдельная временная база, чтобы не трогать bot.db
+_tmp_dir = tempfile.mkdtemp(prefix='bench_cards_')
+os.environ.setdefault('SQLITE_PATH', os.path.join(_tmp_dir, 'bench.db'))
+
+from sqlalchemy import event, insert  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+from models import User, Profile  # noqa: E402
+import database  # noqa: E402
+
+
+async def seed(profiles: int):
+    await database.init_db()
+    async with database.engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 10_000 + i, 'username': f'user{i}'} for i in range(1, profiles + 1)
+        ])
+        await conn.execute(insert(Profile), [
+            {
+                'id': i, 'user_id': i, 'description': f'Описание анкеты {i} ' * 5, 'category': 'Игры',
+                'photo_id': f'photo-{i}', 'is_verified': True, 'random_key': random.random(),
+                'rating_count': 3, 'rating_sum': 12.0,
+            }
+            for i in range(1, profiles + 1)
+        ])
+
+
+async def read_orm(profile_id: int):
+    """Прежний способ чтения: ORM-граф с selectinload и повторной загрузкой связи через refresh"""
+    async with database.async_session() as session:
+        result = await session.execute(
+            select(Profile).options(selectinload(Profile.user)).where(Profile.id == profile_id)
+        )
+        profile = result.scalars().first()
+        if profile:
+            await session.refresh(profile, attribute_names=['user'])
+        return profile
+
+
+async def read_card(profile_id: int):
+    return await database.get_profile_for_moderation(profile_id)
+
+
+async def measure(name: str, reader, ids: list[int]) -> dict:
+    queries = 0
+
+    def count(*args):
+        nonlocal queries
+        queries += 1
+
+    event.listen(database.engine.sync_engine, 'before_cursor_execute', count)
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    results = [await reader(profile_id) for profile_id in ids]
+    elapsed = time.perf_counter() - started
+    # Память, которую удерживают прочитанные объекты, и пик за время чтения
+    retained = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    event.remove(database.engine.sync_engine, 'before_cursor_execute', count)
+    assert all(result is not None for result in results)
+    return {
+        'reader': name,
+        'queries_per_card': queries / len(ids),
+        'retained_bytes_per_card': retained / len(ids),
+        'peak_kib': peak / 1024,
+        'ms_per_card': elapsed * 1000 / len(ids),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    await seed(args.profiles)
+    ids = [random.randint(1, args.profiles) for _ in range(args.reads)]
+    # Прогрев: компиляция запросов и пул соединений не должны попадать в замер
+    await read_orm(ids[0])
+    await read_card(ids[0])
+    rows = [await measure('orm + refresh', read_orm, ids), await measure('ProfileCard', read_card, ids)]
+    await database.engine.dispose()
+
+    print(f"{'способ':<16}{'запросов':>10}{'байт/анкета':>14}{'пик, КиБ':>11}{'мс/анкета':>11}")
+    for row in rows:
+        print(f"{row['reader']:<16}{row['queries_per_card']:>10.2f}{row['retained_bytes_per_card']:>14.0f}"
+              f"{row['peak_kib']:>11.0f}{row['ms_per_card']:>11.3f}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
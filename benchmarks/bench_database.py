@@ -0,0 +1,189 @@
+"""Бенчмарк основных функций database.py на наборах 10k/100k/1M анкет для SQLite и PostgreSQL.
+
+Для каждого бэкенда и размера набора база создается заново и заполняется генератором seed.py
+(голоса по закону Ципфа, анкеты на модерации и просроченные), после чего замеряется время
+вызова функций (p50/p99/среднее).
+Результаты печатаются таблицей и сохраняются в JSON, чтобы сравнивать релизы между собой.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_database.py [--sizes 10000,100000] [--backends sqlite,postgres] [--output bench.json]
+
+Каждый прогон идет в отдельном процессе: бэкенд выбирается переменными окружения при импорте
+database.py. Для PostgreSQL используются настройки POSTGRES_* из окружения, база по умолчанию —
+tgevaluation_bench. ВНИМАНИЕ: таблицы в ней удаляются и создаются заново.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = '10000,100000,1000000'
+DEFAULT_BACKENDS = 'sqlite,postgres'
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def seed(database, args) -> dict:
+    """Пересоздает таблицы и заполняет их: по пользователю на анкету, 10% анкет на модерации, 2% просрочены"""
+    from models import Base
+    from seed import seed_database
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await database.init_db()
+    return await seed_database(
+        database.engine, args.size, votes=args.size * args.votes_per_profile,
+        views_per_vote=args.views_per_vote, seed=args.seed
+    )
+
+
+async def measure(call, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - started)
+    return {
+        'calls': repeat,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': sum(timings) * 1000 / repeat,
+    }
+
+
+async def run_worker(args) -> dict:
+    """Один прогон: один бэкенд и один размер набора в текущем процессе"""
+    import database
+    from seed import CATEGORIES, TELEGRAM_ID_BASE
+
+    random.seed(args.seed)
+    started = time.perf_counter()
+    rows = await seed(database, args)
+    seed_seconds = time.perf_counter() - started
+
+    def random_user() -> int:
+        return random.randint(1, args.size)
+
+    def random_category() -> str:
+        return random.choice(['Все'] + CATEGORIES)
+
+    benchmarks = [
+        ('get_random_profile_by_category', args.repeat, lambda: database.get_random_profile_by_category(
+            TELEGRAM_ID_BASE + random_user(), random_category())),
+        ('get_unviewed_profiles_count', args.repeat, lambda: database.get_unviewed_profiles_count(
+            TELEGRAM_ID_BASE + random_user())),
+        ('get_winner_profile', args.repeat_heavy, database.get_winner_profile),
+        ('get_need_profiles', args.repeat_heavy, database.get_need_profiles),
+        ('create_rating', args.repeat, lambda: database.create_rating(
+            random_user(), random_user(), random.randint(1, 5), None)),
+        ('mark_profile_as_viewed', args.repeat, lambda: database.mark_profile_as_viewed(
+            TELEGRAM_ID_BASE + random_user(), random_user())),
+        # Удаляет все анкеты с истекшим сроком, поэтому идет последним и один раз
+        ('delete_ex_profiles', 1, database.delete_ex_profiles),
+    ]
+    results = {}
+    for name, repeat, call in benchmarks:
+        # Прогрев: компиляция запроса и соединения пула не должны попадать в замер
+        if repeat > 1:
+            await call()
+        results[name] = await measure(call, repeat)
+    await database.engine.dispose()
+    return {
+        'backend': args.backend,
+        'size': args.size,
+        'rows': rows,
+        'seed_seconds': seed_seconds,
+        'results': results,
+    }
+
+
+def run_in_subprocess(args, backend: str, size: int) -> dict | None:
+    env = dict(os.environ)
+    if backend == 'postgres':
+        env['USE_POSTGRESQL'] = 'true'
+        env.setdefault('POSTGRES_DB', 'tgevaluation_bench')
+    else:
+        env['USE_POSTGRESQL'] = 'false'
+        env['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_db_'), 'bench.db')
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker', '--backend', backend, '--size', str(size),
+        '--repeat', str(args.repeat), '--repeat-heavy', str(args.repeat_heavy), '--seed', str(args.seed),
+        '--votes-per-profile', str(args.votes_per_profile), '--views-per-vote', str(args.views_per_vote),
+    ]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        error = (completed.stderr.strip().splitlines() or ['неизвестная ошибка'])[-1]
+        print(f"⚠️ {backend}/{size}: прогон завершился с ошибкой: {error}", file=sys.stderr)
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(run: dict):
+    print(f"\n{run['backend']}, {run['size']} анкет (заполнение {run['seed_seconds']:.1f} с, {run['rows']})")
+    print(f"{'функция':<34}{'вызовов':>8}{'p50, мс':>10}{'p99, мс':>10}{'сред., мс':>11}")
+    for name, result in run['results'].items():
+        print(f"{name:<34}{result['calls']:>8}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['mean_ms']:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='размеры наборов через запятую (число анкет)')
+    parser.add_argument('--backends', default=DEFAULT_BACKENDS, help='sqlite, postgres или оба через запятую')
+    parser.add_argument('--repeat', type=int, default=200, help='вызовов на легкую функцию')
+    parser.add_argument('--repeat-heavy', type=int, default=5, help='вызовов для get_winner_profile и get_need_profiles')
+    parser.add_argument('--votes-per-profile', type=int, default=3, help='в среднем оценок на анкету')
+    parser.add_argument('--views-per-vote', type=float, default=2.0, help='просмотров на одну оценку')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_database.json', help='куда сохранить результаты')
+    # Служебные параметры прогона в дочернем процессе
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--backend', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(args)), ensure_ascii=False))
+        return
+
+    runs = []
+    for backend in args.backends.split(','):
+        for size in (int(size) for size in args.sizes.split(',')):
+            run = run_in_subprocess(args, backend.strip(), size)
+            if run is not None:
+                print_run(run)
+                runs.append(run)
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'args': {key: value for key, value in vars(args).items() if key not in ('worker', 'backend', 'size')},
+        'runs': runs,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    main()
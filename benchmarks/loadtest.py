@@ -0,0 +1,213 @@
+"""Нагрузочный прогон обработчиков бота через Dispatcher из main.py и локальную замену Bot API.
+
+Синтетические пользователи регистрируются (/start, создание анкеты), администратор одобряет
+анкеты, после чего все пользователи одновременно оценивают анкеты. Обновления подаются прямо
+в dp.feed_update() волнами: в одной волне у каждого пользователя одно обновление одного типа,
+так что запросы к базе и вызовы Bot API за волну относятся к этому типу целиком (включая
+отложенную запись голосов, которая сбрасывается в конце волны).
+
+Отчет по каждому типу обновлений: обновлений в секунду, p50/p99 времени обработки,
+SQL-запросов и вызовов Bot API на одно обновление.
+
+Запуск из корня репозитория:
+    python benchmarks/loadtest.py [--users 2000] [--votes 10] [--concurrency 500] [--api-latency 0.03] [--json out.json]
+
+Лимиты исходящих сообщений (SEND_*) по умолчанию сняты, чтобы мерить бота, а не очередь отправки;
+чтобы прогнать с лимитами Telegram, задайте SEND_* явно в окружении.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Отдельная временная база, чтобы не трогать bot.db
+_tmp_dir = tempfile.mkdtemp(prefix='loadtest_')
+os.environ.setdefault('SQLITE_PATH', os.path.join(_tmp_dir, 'bench.db'))
+os.environ.setdefault('FSM_STORAGE', 'memory')
+os.environ.setdefault('FSM_DATABASE_URL', f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'fsm.db')}")
+for _name in ('SEND_GLOBAL_RATE', 'SEND_GLOBAL_BURST', 'SEND_CHAT_RATE', 'SEND_CHAT_BURST'):
+    os.environ.setdefault(_name, '1000000')
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+import database  # noqa: E402
+import fake_bot_api  # noqa: E402
+from main import create_dispatcher  # noqa: E402
+from seed import CATEGORIES  # noqa: E402
+from sender import outbound  # noqa: E402
+
+ADMIN_ID = 1653541807
+USER_ID_BASE = 100_000
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoadDriver:
+    """Подает синтетические обновления в диспетчер и собирает статистику по типам обновлений"""
+
+    def __init__(self, dp, bot: Bot, api: fake_bot_api.FakeBotAPI, concurrency: int):
+        self.dp = dp
+        self.bot = bot
+        self.api = api
+        self.concurrency = concurrency
+        self.queries = 0
+        self.stats = {}
+        event.listen(database.engine.sync_engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        self.queries += 1
+
+    async def wave(self, kind: str, updates: list[dict]):
+        """Подает пачку обновлений одного типа не более чем concurrency одновременно"""
+        stats = self.stats.setdefault(kind, {
+            'updates': 0, 'errors': 0, 'seconds': 0.0, 'queries': 0, 'api_calls': 0, 'latencies': []
+        })
+        semaphore = asyncio.Semaphore(self.concurrency)
+        queries_before = self.queries
+        calls_before = sum(self.api.calls.values())
+
+        async def feed(raw: dict):
+            async with semaphore:
+                update = Update.model_validate(raw, context={'bot': self.bot})
+                started = time.perf_counter()
+                try:
+                    await self.dp.feed_update(self.bot, update)
+                except Exception:
+                    stats['errors'] += 1
+                stats['latencies'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(feed(raw) for raw in updates))
+        # Хвосты волны: неожидаемые отправки и буфер отложенной записи голосов
+        await outbound.drain()
+        await database.flush_votes()
+        stats['seconds'] += time.perf_counter() - started
+        stats['updates'] += len(updates)
+        stats['queries'] += self.queries - queries_before
+        stats['api_calls'] += sum(self.api.calls.values()) - calls_before
+
+    def messages(self, users: list[int], text) -> list[dict]:
+        return [
+            fake_bot_api.message_update(self.api.next_update_id(), user, text(user) if callable(text) else text)
+            for user in users
+        ]
+
+    def callbacks(self, users: list[int], data) -> list[dict]:
+        return [
+            fake_bot_api.callback_update(self.api.next_update_id(), user, data(user) if callable(data) else data)
+            for user in users
+        ]
+
+    def scores(self, users: list[int]) -> list[dict]:
+        """Нажатие случайной оценки под последней карточкой каждого пользователя; пользователи,
+        которым анкеты закончились, пропускают волну"""
+        updates = []
+        for user in users:
+            message = self.api.last_messages.get(user) or {}
+            buttons = [
+                button['callback_data']
+                for row in message.get('reply_markup', {}).get('inline_keyboard', [])
+                for button in row if button.get('callback_data', '').startswith('score_')
+            ]
+            if buttons:
+                updates.append(fake_bot_api.callback_update(
+                    self.api.next_update_id(), user, random.choice(buttons), message
+                ))
+        return updates
+
+    def report(self) -> list[dict]:
+        rows = []
+        for kind, stats in self.stats.items():
+            count = stats['updates'] or 1
+            rows.append({
+                'update': kind,
+                'updates': stats['updates'],
+                'errors': stats['errors'],
+                'updates_per_sec': stats['updates'] / stats['seconds'] if stats['seconds'] else 0.0,
+                'p50_ms': percentile(stats['latencies'], 0.50) * 1000,
+                'p99_ms': percentile(stats['latencies'], 0.99) * 1000,
+                'queries_per_update': stats['queries'] / count,
+                'api_calls_per_update': stats['api_calls'] / count,
+            })
+        return rows
+
+
+async def run(args) -> list[dict]:
+    await database.init_db()
+    database.start_vote_writer()
+    api = fake_bot_api.FakeBotAPI(latency=args.api_latency)
+    runner = await api.start('127.0.0.1', args.api_port)
+    bot = Bot(
+        token='123456:loadtest',
+        session=AiohttpSession(api=TelegramAPIServer.from_base(f'http://127.0.0.1:{args.api_port}'))
+    )
+    driver = LoadDriver(create_dispatcher(), bot, api, args.concurrency)
+    users = [USER_ID_BASE + i for i in range(args.users)]
+    try:
+        # Регистрация и создание анкет
+        await driver.wave('start', driver.messages(users, '/start'))
+        await driver.wave('create_profile', driver.messages(users, '📝 Создать анкету'))
+        await driver.wave('profile_category', driver.messages(users, lambda user: random.choice(CATEGORIES)))
+        await driver.wave('profile_description', driver.messages(users, lambda user: f'Анкета пользователя {user}'))
+        await driver.wave('profile_skip_media', driver.messages(users, 'пропустить'))
+        # Модерация
+        pending = [profile.id for profile in await database.get_need_profiles()]
+        await driver.wave('verify', [
+            fake_bot_api.callback_update(api.next_update_id(), ADMIN_ID, f'verify_{profile_id}')
+            for profile_id in pending
+        ])
+        # Оценивание: все пользователи одновременно
+        await driver.wave('open_rating', driver.messages(users, '👥 Оценить анкеты'))
+        await driver.wave('select_category', driver.callbacks(
+            users, lambda user: f"select_category_{'Все' if random.random() < 0.5 else random.choice(CATEGORIES)}"
+        ))
+        for _ in range(args.votes):
+            await driver.wave('score', driver.scores(users))
+    finally:
+        await database.stop_vote_writer()
+        await outbound.drain()
+        await bot.session.close()
+        await runner.cleanup()
+        await database.engine.dispose()
+    return driver.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help='число синтетических пользователей')
+    parser.add_argument('--votes', type=int, default=10, help='сколько оценок ставит каждый пользователь')
+    parser.add_argument('--concurrency', type=int, default=500, help='обновлений в обработке одновременно')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, с')
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить отчет в JSON-файл')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    rows = asyncio.run(run(args))
+    print(f"{'обновление':<20}{'кол-во':>8}{'ошибок':>8}{'upd/s':>9}{'p50, мс':>9}{'p99, мс':>9}"
+          f"{'SQL/upd':>9}{'API/upd':>9}")
+    for row in rows:
+        print(f"{row['update']:<20}{row['updates']:>8}{row['errors']:>8}{row['updates_per_sec']:>9.0f}"
+              f"{row['p50_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['queries_per_update']:>9.2f}"
+              f"{row['api_calls_per_update']:>9.2f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': rows}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(frozen=True, slots=True)
+class ProfileCard:
+    """Анкета для показа в обработчиках: поля анкеты и автора из одного узкого запроса, без ORM-графа.
+
+    Порядок полей совпадает с порядком колонок в database._card_query().
+    """
+    id: int
+    user_id: int
+    telegram_id: int
+    username: str | None
+    description: str
+    category: str
+    video_id: str | None
+    photo_id: str | None
+    is_verified: bool
+    rating_count: int
+    rating_sum: float
+    created_at: datetime | None
+    delete_at: datetime | None
+    version: int
+
+    @property
+    def avg_rating(self) -> float:
+        return self.rating_sum / self.rating_count if self.rating_count else 0
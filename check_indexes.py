@@ -0,0 +1,84 @@
+"""Проверка планов горячих запросов: каждый из них должен идти по индексу, а не полным сканом таблицы.
+
+Запуск: python check_indexes.py (использует ту же базу, что и бот; схема доводится до актуальной через init_db)
+"""
+from datetime import datetime
+import database
+import asyncio
+import sys
+
+
+def hot_queries():
+    """Запросы из database.py, которые выполняются на каждое действие пользователя.
+
+    Берутся из тех же построителей, что вызывает бот, поэтому проверка не расходится с кодом
+    """
+    viewer_id = 1
+    cursor = (datetime(2024, 1, 1), 1)
+    queries = {
+        'get_user_id': database._user_id_query(1),
+        'get_user_profile': database._user_profile_query(1),
+        'sample_by_category': database._sample_query(
+            database._candidate_conditions(viewer_id, 'Игры'), database.Profile.random_key >= 0.5, 5
+        ),
+        'sample_all': database._sample_query(
+            database._candidate_conditions(viewer_id, 'Все', exclude_ids=[2, 3]), database.Profile.random_key < 0.5, 5
+        ),
+        'get_unviewed_profiles_count': database._unviewed_count_query(viewer_id),
+        'get_category_counts': database._category_counts_query(),
+        'next_pending_profile': database._next_pending_query(cursor),
+        'pending_profiles_count': database._pending_count_query(cursor),
+        'expired_profiles': database._expired_ids_query(datetime.now(), 500),
+        'rating_aggregates_update': database._rating_aggregates_update([1, 2]),
+    }
+    for name, statement in zip(('ratings_by_profile', 'views_by_profile', 'profiles_by_id'),
+                               database._delete_profiles_statements([1, 2])):
+        queries[name] = statement
+    for name, statement in zip(('views_by_viewer', 'ratings_by_rater'), database._delete_user_activity_statements(1)):
+        queries[name] = statement
+    return queries
+
+
+def _full_scans(dialect_name: str, plan: list[str]) -> list[str]:
+    if dialect_name == 'postgresql':
+        return [line for line in plan if 'Seq Scan' in line]
+    # SQLite: "SCAN table" без индекса — полный просмотр таблицы
+    return [line for line in plan if line.startswith('SCAN ') and 'INDEX' not in line]
+
+
+async def explain_hot_queries():
+    """Возвращает {имя запроса: (план, строки с полным сканом)}"""
+    await database.init_db()
+    dialect = database.engine.dialect
+    results = {}
+    async with database.engine.connect() as conn:
+        if dialect.name == 'postgresql':
+            # На маленьких таблицах планировщик и так выберет Seq Scan — проверяем, что индекс вообще применим
+            await conn.exec_driver_sql('SET enable_seqscan = off')
+            prefix = 'EXPLAIN '
+        else:
+            prefix = 'EXPLAIN QUERY PLAN '
+        for name, statement in hot_queries().items():
+            # render_postcompile раскрывает списки IN (...) в отдельные параметры
+            compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+            params = tuple(compiled.params[key] for key in compiled.positiontup or ())
+            result = await conn.exec_driver_sql(prefix + str(compiled), params)
+            plan = [str(row[-1]) for row in result.fetchall()]
+            results[name] = (plan, _full_scans(dialect.name, plan))
+    await database.engine.dispose()
+    return results
+
+
+async def main():
+    results = await explain_hot_queries()
+    failed = False
+    for name, (plan, scans) in results.items():
+        status = 'FULL SCAN' if scans else 'OK'
+        failed = failed or bool(scans)
+        print(f"[{status}] {name}")
+        for line in plan:
+            print(f"    {line}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""Сверка get_winner_profile с прежней реализацией, которая загружала все анкеты вместе с оценками.
+
+На каждом зерне генерируется случайный набор анкет и оценок (часть наборов без анкет с 5+ оценками,
+чтобы проверить и запасное правило), после чего победители обеих реализаций сравниваются.
+Агрегаты анкет пересчитываются из таблицы ratings тем же кодом, что и при миграции.
+
+Запуск: python check_winner.py [--seeds 60] [--first-seed 1]
+(работает на временной базе SQLite, bot.db не трогает; при расхождении выходит с кодом 1)
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+# Отдельная временная база, чтобы не трогать bot.db
+_tmp_dir = tempfile.mkdtemp(prefix='check_winner_')
+os.environ['USE_POSTGRESQL'] = 'false'
+os.environ['SQLITE_PATH'] = os.path.join(_tmp_dir, 'check.db')
+
+from sqlalchemy import delete, insert  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+from models import User, Profile, Rating, ProfileView  # noqa: E402
+import database  # noqa: E402
+
+
+async def legacy_winner_profile():
+    """get_winner_profile до перехода на агрегаты: все одобренные анкеты с оценками, подсчет в Python"""
+    async with database.async_session() as session:
+        result = await session.execute(
+            select(Profile)
+            .options(selectinload(Profile.user), selectinload(Profile.received_ratings))
+            .where(Profile.is_verified == True)
+            # Прежний запрос шел без ORDER BY, и SQLite обходил таблицу по rowid; без явного порядка
+            # план (а с ним и порядок обхода) зависел бы от того, какой индекс создан первым
+            .order_by(Profile.id)
+        )
+        profiles = result.scalars().all()
+        if not profiles:
+            return None
+
+        # Сначала пробуем строгие правила (>=5 оценок и разница в 0.3)
+        winner = None
+        max_avg = -1.0
+        max_count = -1
+        for profile in profiles:
+            ratings = profile.received_ratings or []
+            count = len(ratings)
+            if count < 5:
+                continue
+            avg = sum(r.score for r in ratings) / count if ratings else 0
+            if avg > max_avg + 0.3:
+                winner = profile
+                max_avg = avg
+                max_count = count
+            elif abs(avg - max_avg) <= 0.3:
+                if count > max_count:
+                    winner = profile
+                    max_avg = avg
+                    max_count = count
+
+        if winner:
+            return winner
+
+        # Fallback: если нет профилей с >=5 оценками, выбираем лучшего из тех, у кого >=1
+        fallback_winner = None
+        fallback_max_avg = -1.0
+        fallback_max_count = -1
+        for profile in profiles:
+            ratings = profile.received_ratings or []
+            count = len(ratings)
+            if count == 0:
+                continue
+            avg = sum(r.score for r in ratings) / count
+            if avg > fallback_max_avg:
+                fallback_winner = profile
+                fallback_max_avg = avg
+                fallback_max_count = count
+            elif abs(avg - fallback_max_avg) < 1e-9:
+                if count > fallback_max_count:
+                    fallback_winner = profile
+                    fallback_max_avg = avg
+                    fallback_max_count = count
+        return fallback_winner
+
+
+async def seed_corpus(seed: int) -> dict:
+    """Заполняет базу случайным набором; каждое третье зерно — без анкет с 5+ оценками"""
+    rng = random.Random(seed)
+    users = rng.randint(10, 60)
+    profiles = rng.randint(1, users)
+    max_votes = 4 if seed % 3 == 0 else min(users - 1, 15)
+    rating_rows = []
+    profile_rows = []
+    for i in range(1, profiles + 1):
+        profile_rows.append({
+            'id': i, 'user_id': i, 'description': f'Анкета {i}', 'category': 'Игры',
+            'is_verified': rng.random() < 0.8, 'random_key': rng.random(),
+        })
+        raters = rng.sample([u for u in range(1, users + 1) if u != i], rng.randint(0, max_votes))
+        # Узкий набор оценок дает много ничьих и почти-ничьих в пределах 0.3
+        scores = rng.choice([(3, 4, 5), (4, 5), (1, 2, 3, 4, 5)])
+        rating_rows += [{'rater_id': rater, 'profile_id': i, 'score': rng.choice(scores)} for rater in raters]
+
+    async with database.engine.begin() as conn:
+        for model in (Rating, ProfileView, Profile, User):
+            await conn.execute(delete(model))
+        await conn.execute(insert(User), [
+            {'id': i, 'telegram_id': 10_000 + i, 'username': f'user{i}'} for i in range(1, users + 1)
+        ])
+        await conn.execute(insert(Profile), profile_rows)
+        if rating_rows:
+            await conn.execute(insert(Rating), rating_rows)
+    await database.reconcile_rating_aggregates()
+    return {'users': users, 'profiles': profiles, 'ratings': len(rating_rows)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seeds', type=int, default=60, help='сколько случайных наборов проверить')
+    parser.add_argument('--first-seed', type=int, default=1)
+    args = parser.parse_args()
+
+    await database.init_db()
+    mismatches = 0
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        corpus = await seed_corpus(seed)
+        legacy = await legacy_winner_profile()
+        current = await database.get_winner_profile()
+        legacy_id = legacy.id if legacy is not None else None
+        current_id = current.id if current is not None else None
+        status = 'OK' if legacy_id == current_id else 'MISMATCH'
+        mismatches += legacy_id != current_id
+        print(f"[{status}] seed={seed} {corpus}: прежний={legacy_id} текущий={current_id}")
+    await database.engine.dispose()
+    print(f"Расхождений: {mismatches} из {args.seeds}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,11 +1,18 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, selectinload
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy import func, and_, desc, delete, text
+from sqlalchemy import func, and_, or_, desc, delete, text, update, inspect, bindparam, event
+from sqlalchemy.dialects import postgresql, sqlite
 from models import Base, User, Profile, Rating, ProfileView
+from cards import ProfileCard
+from cache import TTLCache
+from metrics import timed, instrument_engine, register_cache, current_db_function
+from functools import wraps
 from datetime import datetime
 import logging
 import asyncio
+import random
+import time
 import os
 
 POSTGRES_USER = os.getenv('POSTGRES_USER', 'postgres')
@@ -18,14 +25,170 @@ POSTGRES_DB = os.getenv('POSTGRES_DB', 'tgevaluation')
 USE_POSTGRESQL = os.getenv('USE_POSTGRESQL', 'false').lower() == 'true'
 
 if USE_POSTGRESQL:
-    DATABASE_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 else:
-    DATABASE_URL = "sqlite+aiosqlite:///bot.db"
+    DATABASE_URL = f"sqlite+aiosqlite:///{os.getenv('SQLITE_PATH', 'bot.db')}"
+
+# Пул соединений PostgreSQL
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Кэш подготовленных выражений asyncpg на соединение; 0 — для pgbouncer в режиме transaction
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+
+# Отложенная запись голосов: буфер сбрасывается в базу раз в VOTE_FLUSH_INTERVAL_MS или по VOTE_FLUSH_BATCH голосов
+VOTE_WRITE_BEHIND = os.getenv('VOTE_WRITE_BEHIND', 'false').lower() == 'true'
+VOTE_FLUSH_INTERVAL_MS = int(os.getenv('VOTE_FLUSH_INTERVAL_MS', '50'))
+VOTE_FLUSH_BATCH = int(os.getenv('VOTE_FLUSH_BATCH', '500'))
+
+# Сколько анкет с истекшим сроком удалять за одну транзакцию
+EXPIRY_BATCH_SIZE = int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+
+# Кэш telegram_id -> users.id: соответствие не меняется после создания пользователя
+USER_ID_CACHE_SIZE = int(os.getenv('USER_ID_CACHE_SIZE', '100000'))
+USER_ID_CACHE_TTL = float(os.getenv('USER_ID_CACHE_TTL', '86400'))
+
+# Время жизни каталога категорий: сброс по событию видит только свой процесс, а TTL ограничивает,
+# насколько отстанет каталог, если анкеты одобряет или удаляет другой экземпляр бота
+CATEGORY_CACHE_TTL = float(os.getenv('CATEGORY_CACHE_TTL', '60'))
+
+# Настройки SQLite под конкурентную нагрузку: WAL, ожидание блокировки вместо "database is locked",
+# отображение файла в память и единственный писатель, через которого идут все изменения
+SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_SINGLE_WRITER = not USE_POSTGRESQL and os.getenv('SQLITE_SINGLE_WRITER', 'true').lower() == 'true'
+
+# Логирование каждого SQL-запроса (очень шумно, только для отладки)
+SQL_ECHO = os.getenv('SQL_ECHO', 'false').lower() == 'true'
 
 logger = logging.getLogger(__name__)
 
 engine = None
 async_session = None
+user_id_cache = TTLCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+register_cache('user_id', user_id_cache)
+
+def _engine_options():
+    if not USE_POSTGRESQL:
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'connect_args': {
+            # Кэш SQLAlchemy поверх asyncpg и собственный кэш asyncpg
+            'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+            'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+def _create_engine():
+    new_engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, **_engine_options())
+    instrument_engine(new_engine.sync_engine)
+    if new_engine.dialect.name == 'sqlite':
+        event.listen(new_engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    return new_engine
+
+class _SerialWriter:
+    """Очередь изменений базы, которую разбирает одна задача: записи идут строго по одной,
+    а чтения остаются параллельными (в SQLite одновременно может писать только одно соединение)"""
+
+    def __init__(self):
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, func, args, kwargs):
+        self._ensure_started()
+        future = self._loop.create_future()
+        # Имя функции передаем явно: у задачи писателя свой контекст, и метрики иначе потеряют метку
+        await self._queue.put((func, args, kwargs, current_db_function.get(), future))
+        return await future
+
+    async def _run(self):
+        while True:
+            func, args, kwargs, function_name, future = await self._queue.get()
+            if future.cancelled():
+                continue
+            token = current_db_function.set(function_name)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                current_db_function.reset(token)
+
+_writer = _SerialWriter()
+
+def _serialized_write(func):
+    """Пропускает функцию записи через единственного писателя (только для SQLite).
+    Внутри такой функции нельзя вызывать другие функции с этим декоратором — будет взаимная блокировка"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not SQLITE_SINGLE_WRITER:
+            return await func(*args, **kwargs)
+        return await _writer.submit(func, args, kwargs)
+    return wrapper
+
+async def check_database():
+    """Проверяет соединение с базой и пишет в лог фактические настройки движка и пула"""
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+    pool = engine.pool
+    config = {
+        'url': engine.url.render_as_string(hide_password=True),
+        'driver': engine.dialect.driver,
+        'pool': type(pool).__name__,
+        'pool_size': pool.size() if hasattr(pool, 'size') else None,
+        'max_overflow': getattr(pool, '_max_overflow', None),
+        'pool_timeout': getattr(pool, '_timeout', None),
+        'pre_ping': pool._pre_ping,
+        'pool_recycle': pool._recycle,
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE if USE_POSTGRESQL else None,
+        'status': pool.status(),
+    }
+    logger.info("Соединение с базой проверено: " + ", ".join(f"{key}={value}" for key, value in config.items()))
+    return config
+
+# Подписчики на изменения анкет (удаление, отклонение, правка, одобрение, истечение срока)
+_profile_listeners = []
+
+def add_profile_listener(callback):
+    """Регистрирует callback(profile_ids), вызываемый после изменения набора одобренных анкет"""
+    _profile_listeners.append(callback)
+
+def _notify_profiles_changed(profile_ids):
+    for callback in _profile_listeners:
+        try:
+            callback(profile_ids)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике изменения анкет {profile_ids}: {e}")
 
 async def init_db():
     """Инициализация базы данных PostgreSQL"""
@@ -33,62 +196,251 @@ async def init_db():
     
     try:
         # Создаем движок для PostgreSQL
-        engine = create_async_engine(DATABASE_URL, echo=True)
+        engine = _create_engine()
         async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
         
         # Создаем базу данных с правильной схемой
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            added = await conn.run_sync(_upgrade_schema)
             logger.info("PostgreSQL база данных инициализирована с правильной схемой")
             
     except Exception as e:
         logger.error(f"Ошибка при инициализации PostgreSQL базы данных: {e}")
         raise
 
+    await check_database()
+
+    # Колонки агрегатов только что добавлены в существующую базу — заполняем их.
+    # То же после схлопывания дублей оценок при создании уникального индекса
+    if ('profiles', 'rating_count') in added or ('ratings', 'uq_ratings_rater_profile') in added:
+        await reconcile_rating_aggregates()
+    if ('profiles', 'random_key') in added:
+        await _backfill_random_keys()
+
+# Индексы прежних версий схемы, которые перекрыты новыми и только замедляют запись
+_OBSOLETE_INDEXES = {
+    'ratings': ['ix_ratings_rater_id'],  # заменен уникальным uq_ratings_rater_profile
+}
+
+def _upgrade_schema(sync_conn):
+    """Добавляет в существующие таблицы колонки и индексы, которых нет в старой схеме (create_all их не создает).
+
+    Возвращает добавленное: пары (таблица, колонка) и (таблица, индекс).
+    """
+    inspector = inspect(sync_conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            sync_conn.execute(text(ddl))
+            added.add((table.name, column.name))
+            logger.info(f"Добавлена колонка {table.name}.{column.name}")
+        # create_all не добавляет индексы в уже существующие таблицы
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.unique:
+                _delete_duplicates(sync_conn, table, [column.name for column in index.columns])
+            index.create(sync_conn)
+            added.add((table.name, index.name))
+            logger.info(f"Создан индекс {index.name}")
+        for index_name in _OBSOLETE_INDEXES.get(table.name, []):
+            if index_name in existing_indexes:
+                sync_conn.execute(text(f"DROP INDEX {index_name}"))
+                logger.info(f"Удален устаревший индекс {index_name}")
+    return added
+
+def _delete_duplicates(sync_conn, table, column_names):
+    """Удаляет дубликаты по набору колонок, оставляя самую раннюю строку (наименьший id)"""
+    keep_ids = select(func.min(table.c.id)).group_by(*[table.c[name] for name in column_names])
+    result = sync_conn.execute(delete(table).where(table.c.id.not_in(keep_ids)))
+    if result.rowcount:
+        logger.info(f"Удалено {result.rowcount} дубликатов из {table.name} по {column_names}")
+
+@_serialized_write
+async def _backfill_random_keys():
+    """Раздает случайные ключи анкетам, созданным до появления колонки random_key"""
+    async with async_session() as session:
+        result = await session.execute(select(Profile.id))
+        params = [{'id': profile_id, 'random_key': random.random()} for profile_id in result.scalars()]
+        if params:
+            await session.execute(update(Profile), params)
+        await session.commit()
+        logger.info(f"Случайные ключи выставлены для {len(params)} анкет")
+
+def _rating_aggregates_update(profile_ids=None):
+    """UPDATE, пересчитывающий rating_count/rating_sum анкет по таблице ratings"""
+    count_subquery = (
+        select(func.count(Rating.id))
+        .where(Rating.profile_id == Profile.id)
+        .scalar_subquery()
+    )
+    sum_subquery = (
+        select(func.coalesce(func.sum(Rating.score), 0))
+        .where(Rating.profile_id == Profile.id)
+        .scalar_subquery()
+    )
+    stmt = update(Profile).values(
+        rating_count=count_subquery, rating_sum=sum_subquery, version=Profile.version + 1
+    )
+    if profile_ids is not None:
+        stmt = stmt.where(Profile.id.in_(profile_ids))
+    return stmt.execution_options(synchronize_session=False)
+
+@timed
+@_serialized_write
+async def reconcile_rating_aggregates():
+    """Пересчитывает агрегаты оценок всех анкет (бэкфилл и сверка с таблицей ratings)"""
+    async with async_session() as session:
+        result = await session.execute(_rating_aggregates_update())
+        await session.commit()
+        logger.info(f"Агрегаты оценок пересчитаны для {result.rowcount} анкет")
+        return result.rowcount
+
 # Инициализируем переменные, если они еще не созданы
 if engine is None:
-    engine = create_async_engine(DATABASE_URL, echo=True)
+    engine = _create_engine()
 if async_session is None:
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+@timed
 async def get_user(telegram_id: int):
     async with async_session() as session:
-        print(f"DEBUG: get_user вызвана для telegram_id {telegram_id}")
+        logger.debug(f"get_user вызвана для telegram_id {telegram_id}")
         result = await session.execute(
             select(User).where(User.telegram_id == telegram_id)
         )
         user = result.scalar_one_or_none()
         if not user:
-            print(f"DEBUG: Пользователь с telegram_id {telegram_id} не найден в базе")
+            logger.debug(f"Пользователь с telegram_id {telegram_id} не найден в базе")
         else:
-            print(f"DEBUG: Найден пользователь user_id={user.id}, telegram_id={telegram_id}")
+            logger.debug(f"Найден пользователь user_id={user.id}, telegram_id={telegram_id}")
+            user_id_cache.set(telegram_id, user.id)
         return user
 
+# Построители запросов горячего пути. Функции ниже выполняют именно их, а check_indexes.py
+# проверяет их планы — так проверка не расходится с тем, что на самом деле уходит в базу
+
+def _user_id_query(telegram_id: int):
+    return select(User.id).where(User.telegram_id == telegram_id)
+
+def _user_profile_query(telegram_id: int):
+    # Одобренная анкета в приоритете; если ее нет — последняя любая
+    return (
+        _card_query()
+        .where(User.telegram_id == telegram_id)
+        .order_by(Profile.is_verified.desc(), Profile.created_at.desc())
+        .limit(1)
+    )
+
+def _candidate_conditions(user_id: int, category: str = None, exclude_ids=()):
+    """Условия "анкета подходит пользователю для оценивания": одобрена, не своя, еще не просмотрена"""
+    conditions = [
+        Profile.is_verified == True,
+        Profile.user_id != user_id,
+        _not_viewed_by(user_id)
+    ]
+    if category and category != "Все":
+        conditions.append(Profile.category == category)
+    if exclude_ids:
+        conditions.append(Profile.id.not_in(list(exclude_ids)))
+    return conditions
+
+def _sample_query(conditions, key_condition, limit: int):
+    return _card_query().where(and_(*conditions, key_condition)).order_by(Profile.random_key).limit(limit)
+
+def _unviewed_count_query(user_id: int):
+    return select(func.count(Profile.id)).where(and_(*_candidate_conditions(user_id)))
+
+def _category_counts_query():
+    return (
+        select(Profile.category, func.count(Profile.id))
+        .where(Profile.is_verified == True)
+        .group_by(Profile.category)
+    )
+
+def _pending_count_query(cursor):
+    return select(func.count(Profile.id)).where(_pending_after(cursor))
+
+def _next_pending_query(cursor):
+    return (
+        select(
+            Profile.id, Profile.description, Profile.category, Profile.video_id,
+            Profile.photo_id, Profile.created_at, Profile.version, User.username
+        )
+        .join(User, Profile.user_id == User.id)
+        .where(_pending_after(cursor))
+        .order_by(Profile.created_at, Profile.id)
+        .limit(1)
+    )
+
+def _expired_ids_query(now: datetime, batch_size: int):
+    # Порядок (delete_at, id) отдает сам индекс по delete_at, а ORDER BY id заставлял SQLite
+    # обходить всю таблицу по первичному ключу
+    return select(Profile.id).where(Profile.delete_at <= now).order_by(Profile.delete_at, Profile.id).limit(batch_size)
+
+def _delete_profiles_statements(profile_ids):
+    """DELETE оценок, просмотров и самих анкет — в порядке выполнения"""
+    return [
+        delete(model).where(column.in_(profile_ids)).execution_options(synchronize_session=False)
+        for model, column in ((Rating, Rating.profile_id), (ProfileView, ProfileView.profile_id), (Profile, Profile.id))
+    ]
+
+def _delete_user_activity_statements(user_id: int):
+    """DELETE просмотров и оценок, оставленных пользователем"""
+    return [
+        delete(ProfileView).where(ProfileView.viewer_id == user_id),
+        delete(Rating).where(Rating.rater_id == user_id),
+    ]
+
+@timed
+async def get_user_id(telegram_id: int):
+    """Внутренний id пользователя по telegram_id (через кэш) или None, если пользователя нет"""
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+    async with async_session() as session:
+        result = await session.execute(_user_id_query(telegram_id))
+        user_id = result.scalar_one_or_none()
+    if user_id is not None:
+        user_id_cache.set(telegram_id, user_id)
+    return user_id
+
+async def _resolve_user_id(telegram_id: int, user_id: int | None):
+    return user_id if user_id is not None else await get_user_id(telegram_id)
+
+def _card_query():
+    """SELECT только тех колонок анкеты и автора, из которых собирается ProfileCard"""
+    return select(
+        Profile.id, Profile.user_id, User.telegram_id, User.username, Profile.description,
+        Profile.category, Profile.video_id, Profile.photo_id, Profile.is_verified,
+        Profile.rating_count, Profile.rating_sum, Profile.created_at, Profile.delete_at, Profile.version,
+    ).join(User, Profile.user_id == User.id)
+
+def _cards(result) -> list[ProfileCard]:
+    return [ProfileCard(*row) for row in result]
+
+def _card(result) -> ProfileCard | None:
+    row = result.first()
+    return ProfileCard(*row) if row is not None else None
+
+@timed
 async def get_user_profile(telegram_id: int):
     async with async_session() as session:
-        # Сначала ищем одобренную анкету
-        result = await session.execute(
-            select(Profile)
-            .options(selectinload(Profile.user), selectinload(Profile.received_ratings))
-            .join(User, Profile.user_id == User.id)
-            .where(User.telegram_id == telegram_id, Profile.is_verified == True)
-            .order_by(Profile.created_at.desc())
-        )
-        profile = result.scalars().first()
-        if profile:
-            return profile
-        # Если одобренной нет — возвращаем последнюю любую анкету
-        result = await session.execute(
-            select(Profile)
-            .options(selectinload(Profile.user), selectinload(Profile.received_ratings))
-            .join(User, Profile.user_id == User.id)
-            .where(User.telegram_id == telegram_id)
-            .order_by(Profile.created_at.desc())
-            .limit(1)
-        )
-        return result.scalar_one_or_none()
+        result = await session.execute(_user_profile_query(telegram_id))
+        return _card(result)
 
 
+@timed
+@_serialized_write
 async def create_user(telegram_id: int, username: str | None):
     async with async_session() as session:
         try:
@@ -98,12 +450,14 @@ async def create_user(telegram_id: int, username: str | None):
             existing_user = existing_user_result.scalar_one_or_none()
             if existing_user:
                 logger.info(f"Пользователь уже существует: telegram_id={telegram_id}")
+                user_id_cache.set(telegram_id, existing_user.id)
                 return existing_user
             
             # Убеждаемся, что username может быть None
             user = User(telegram_id=telegram_id, username=username)
             session.add(user)
             await session.commit()
+            user_id_cache.set(telegram_id, user.id)
             logger.info(f"Создан новый пользователь: id={user.id}, telegram_id={telegram_id}, username={username}")
             return user
         except Exception as e:
@@ -111,6 +465,8 @@ async def create_user(telegram_id: int, username: str | None):
             await session.rollback()
             raise
 
+@timed
+@_serialized_write
 async def create_profile(user_id: int, description: str, category: str, video_id: str | None, photo_id: str | None):
     async with async_session() as session:
         user_result = await session.execute(
@@ -128,129 +484,126 @@ async def create_profile(user_id: int, description: str, category: str, video_id
         logger.info(f"Создана новая анкета: id={profile.id}, user_id={user_id}")
         return profile
 
-async def get_random_profile(ex_user_id: int):
+def _not_viewed_by(user_id: int):
+    """Условие "анкета еще не просмотрена пользователем" в виде коррелированного NOT EXISTS"""
+    return ~(
+        select(ProfileView.id)
+        .where(ProfileView.viewer_id == user_id, ProfileView.profile_id == Profile.id)
+        .exists()
+    )
+
+async def _sample_profiles(session, conditions, limit: int = 1):
+    """Случайные анкеты среди подходящих под условия.
+
+    Вместо ORDER BY random() берем случайную точку и ищем по индексу первые анкеты
+    с random_key не меньше нее; если справа не хватило — идем по кругу с начала.
+    """
+    pivot = random.random()
+    profiles = []
+    for key_condition in (Profile.random_key >= pivot, Profile.random_key < pivot):
+        result = await session.execute(_sample_query(conditions, key_condition, limit - len(profiles)))
+        profiles.extend(_cards(result))
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+async def _sample_profile(session, conditions):
+    profiles = await _sample_profiles(session, conditions, limit=1)
+    return profiles[0] if profiles else None
+
+@timed
+async def get_random_profile(ex_user_id: int, user_id: int | None = None):
+    # Получаем внутренний ID пользователя
+    user_id = await _resolve_user_id(ex_user_id, user_id)
+    if user_id is None:
+        logger.debug(f"Пользователь не найден: telegram_id={ex_user_id}")
+        return None
     async with async_session() as session:
-        # Получаем пользователя
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == ex_user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
-            print(f"DEBUG: Пользователь не найден: telegram_id={ex_user_id}")
-            return None
-        
-        # Получаем ID просмотренных анкет
-        viewed_profiles_result = await session.execute(
-            select(ProfileView.profile_id).where(ProfileView.viewer_id == user.id)
-        )
-        viewed_profile_ids = [row[0] for row in viewed_profiles_result.fetchall()]
-        
-        # Отладочная информация
-        all_profiles_result = await session.execute(
-            select(Profile).where(Profile.is_verified == True)
-        )
-        all_profiles = all_profiles_result.scalars().all()
-        print(f"DEBUG: Всего одобренных анкет в базе: {len(all_profiles)}")
-        for p in all_profiles:
-            print(f"DEBUG: Анкета profile_id={p.id}, user_id={p.user_id}, is_verified={p.is_verified}")
-        
-        # Формируем условия для выборки
-        conditions = [
-            Profile.is_verified == True,
-            Profile.user_id != user.id
-        ]
-        if viewed_profile_ids:
-            conditions.append(~Profile.id.in_(viewed_profile_ids))
-        
-        query = select(Profile).options(
-            selectinload(Profile.user), 
-            selectinload(Profile.received_ratings)
-        ).where(
-            and_(*conditions)
-        ).order_by(func.random()).limit(1)
-        
-        result = await session.execute(query)
-        profile = result.scalars().first()
+        # Формируем условия для выборки, исключая уже просмотренные анкеты
+        profile = await _sample_profile(session, _candidate_conditions(user_id))
         
         if profile:
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-            print(f"DEBUG: Возвращена анкета для пользователя {ex_user_id}: profile_id={profile.id}, user_id={profile.user_id}")
+            logger.debug(f"Возвращена анкета для пользователя {ex_user_id}: profile_id={profile.id}, user_id={profile.user_id}")
         else:
-            print(f"DEBUG: Нет доступных анкет для пользователя {ex_user_id}")
-            print(f"DEBUG: Причины: user_id={user.id}, просмотренные={viewed_profile_ids}")
+            logger.debug(f"Нет доступных анкет для пользователя {ex_user_id}")
+            logger.debug(f"Причины: user_id={user_id}")
         
         return profile
 
-async def get_random_profile_by_category(ex_user_id: int, category: str = None):
+@timed
+async def get_random_profile_by_category(ex_user_id: int, category: str = None, user_id: int | None = None):
     """Получить случайную анкету для оценивания по категории"""
+    # Сначала получаем внутренний ID пользователя по telegram_id
+    user_id = await _resolve_user_id(ex_user_id, user_id)
+    if user_id is None:
+        return None
     async with async_session() as session:
-        # Сначала получаем внутренний ID пользователя по telegram_id
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == ex_user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
-            return None
-        
-        conditions = [
-            Profile.is_verified == True,
-            Profile.user_id != user.id  # Используем внутренний ID пользователя
-        ]
-        
-        if category and category != "Все":
-            conditions.append(Profile.category == category)
-        
-        # Исключаем уже просмотренные анкеты
-        viewed_profiles = await session.execute(
-            select(ProfileView.profile_id).where(ProfileView.viewer_id == user.id)
-        )
-        viewed_profile_ids = [row[0] for row in viewed_profiles.fetchall()]
-        if viewed_profile_ids:
-            conditions.append(Profile.id.notin_(viewed_profile_ids))
-        
-        query = select(Profile).options(
-            selectinload(Profile.user), 
-            selectinload(Profile.received_ratings)
-        ).where(
-            and_(*conditions)
-        ).order_by(func.random()).limit(1)
-        
-        result = await session.execute(query)
-        profile = result.scalars().first()
+        # Используем внутренний ID пользователя и исключаем уже просмотренные анкеты
+        profile = await _sample_profile(session, _candidate_conditions(user_id, category))
         
         if profile:
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-            print(f"DEBUG: Возвращена анкета категории {category} для пользователя {ex_user_id}: profile_id={profile.id}, user_id={profile.user_id}")
+            logger.debug(f"Возвращена анкета категории {category} для пользователя {ex_user_id}: profile_id={profile.id}, user_id={profile.user_id}")
         else:
-            print(f"DEBUG: Нет доступных анкет категории {category} для пользователя {ex_user_id}")
+            logger.debug(f"Нет доступных анкет категории {category} для пользователя {ex_user_id}")
         
         return profile
 
+@timed
+async def get_random_profiles_by_category(ex_user_id: int, category: str = None, limit: int = 5, exclude_ids=(), user_id: int | None = None):
+    """Пачка случайных непросмотренных анкет категории (для предзагрузки колоды)"""
+    user_id = await _resolve_user_id(ex_user_id, user_id)
+    if user_id is None:
+        return []
+    async with async_session() as session:
+        return await _sample_profiles(session, _candidate_conditions(user_id, category, exclude_ids), limit=limit)
+
+# Каталог категорий {категория: число одобренных анкет}; сбрасывается, когда меняется набор одобренных анкет,
+# и в любом случае не живет дольше CATEGORY_CACHE_TTL
+category_cache = TTLCache(maxsize=1, ttl=CATEGORY_CACHE_TTL)
+register_cache('category_counts', category_cache)
+_category_generation = 0
+
+def _invalidate_categories(profile_ids):
+    global _category_generation
+    category_cache.clear()
+    _category_generation += 1
+
+add_profile_listener(_invalidate_categories)
+
+@timed
+async def get_category_counts():
+    """Количество одобренных анкет по категориям (из кэша)"""
+    counts = category_cache.get('counts')
+    if counts is None:
+        generation = _category_generation
+        async with async_session() as session:
+            result = await session.execute(_category_counts_query())
+            counts = {category: count for category, count in result.all()}
+        # Если каталог сбросили, пока шел запрос, результат уже устарел — не кэшируем его
+        if generation != _category_generation:
+            return counts
+        category_cache.set('counts', counts)
+    return dict(counts)
+
+@timed
 async def get_available_categories():
     """Получить список всех доступных категорий"""
-    async with async_session() as session:
-        result = await session.execute(
-            select(Profile.category).where(Profile.is_verified == True).distinct()
-        )
-        categories = [row[0] for row in result.fetchall()]
-        return ["Все"] + sorted(categories)
+    counts = await get_category_counts()
+    return ["Все"] + sorted(counts)
 
-async def mark_profile_as_viewed(viewer_telegram_id: int, profile_id: int):
+@timed
+@_serialized_write
+async def mark_profile_as_viewed(viewer_telegram_id: int, profile_id: int, user_id: int | None = None):
+    user_id = await _resolve_user_id(viewer_telegram_id, user_id)
+    if user_id is None:
+        logger.error(f"Пользователь не найден: telegram_id={viewer_telegram_id}")
+        return False
     async with async_session() as session:
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == viewer_telegram_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
-            logger.error(f"Пользователь не найден: telegram_id={viewer_telegram_id}")
-            return False
-        # Используем user.id для поиска и создания ProfileView
+        # Используем внутренний id для поиска и создания ProfileView
         existing_view_result = await session.execute(
             select(ProfileView).where(
                 and_(
-                    ProfileView.viewer_id == user.id,
+                    ProfileView.viewer_id == user_id,
                     ProfileView.profile_id == profile_id
                 )
             )
@@ -260,36 +613,244 @@ async def mark_profile_as_viewed(viewer_telegram_id: int, profile_id: int):
             existing_view.viewed_at = datetime.utcnow()
             logger.info(f"Обновлен просмотр: пользователь {viewer_telegram_id}, анкета {profile_id}")
         else:
-            profile_view = ProfileView(viewer_id=user.id, profile_id=profile_id)
+            profile_view = ProfileView(viewer_id=user_id, profile_id=profile_id)
             session.add(profile_view)
             logger.info(f"Создан новый просмотр: пользователь {viewer_telegram_id}, анкета {profile_id}")
         await session.commit()
         return True
     
-async def create_rating(rater_id: int, profile_id: int, score: float, comment: str):
-    async with async_session() as session:
-        rating = Rating(rater_id=rater_id, profile_id=profile_id, score=score, comment=comment)
-        session.add(rating)
-        await session.commit()
-        return rating
+def _insert(table):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей базы"""
+    if engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
 
-async def delete_ex_profiles():
+def _rating_insert():
+    """INSERT оценки, который молча пропускает повторную оценку той же анкеты тем же пользователем
+    и возвращает только действительно вставленные строки"""
+    return (
+        _insert(Rating.__table__)
+        .on_conflict_do_nothing(index_elements=['rater_id', 'profile_id'])
+        .returning(Rating.id, Rating.rater_id, Rating.profile_id, Rating.score)
+    )
+
+@timed
+@_serialized_write
+async def create_rating(rater_id: int, profile_id: int, score: float, comment: str):
+    """Добавляет оценку и обновляет агрегаты анкеты. Возвращает id оценки или None,
+    если пользователь уже оценивал эту анкету"""
     async with async_session() as session:
         result = await session.execute(
-            select(Profile).where(Profile.delete_at <= datetime.utcnow())
+            _rating_insert().values(rater_id=rater_id, profile_id=profile_id, score=score, comment=comment)
         )
-        ex_profiles = result.scalars().all()
-        for profile in ex_profiles:
-            await session.execute(
-                delete(Rating).where(Rating.profile_id == profile.id)
-            )
-            await session.execute(
-                delete(ProfileView).where(ProfileView.profile_id == profile.id)
+        rating_id = result.scalar()
+        if rating_id is None:
+            return None
+        # Агрегаты обновляем в той же транзакции, что и саму оценку
+        await session.execute(
+            update(Profile)
+            .where(Profile.id == profile_id)
+            .values(
+                rating_count=Profile.rating_count + 1,
+                rating_sum=Profile.rating_sum + score,
+                version=Profile.version + 1
             )
-            await session.delete(profile)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return rating_id
+
+async def _write_votes(session, votes) -> set:
+    """Записывает пачку голосов: оценки, просмотры и агрегаты анкет в текущей транзакции.
+
+    Повторные голоса за ту же пару (пользователь, анкета) — и внутри пачки, и уже записанные —
+    пропускаются без отдельного SELECT. Возвращает пары, голоса за которые действительно записаны.
+    """
+    # Внутри пачки оставляем первый голос пары, как и при схлопывании дублей в базе
+    first_votes = {}
+    for vote in votes:
+        first_votes.setdefault((vote[0], vote[1]), vote)
+    connection = await session.connection()
+    result = await connection.execute(_rating_insert(), [
+        {'rater_id': rater_id, 'profile_id': profile_id, 'score': score, 'comment': comment, 'created_at': voted_at}
+        for rater_id, profile_id, score, comment, voted_at in first_votes.values()
+    ])
+    # Агрегаты считаем только по вставленным строкам
+    inserted = set()
+    aggregates = {}
+    for row in result:
+        inserted.add((row.rater_id, row.profile_id))
+        count, total = aggregates.get(row.profile_id, (0, 0))
+        aggregates[row.profile_id] = (count + 1, total + row.score)
+
+    # Просмотр на пару (пользователь, анкета) один — обновляем время, если он уже есть
+    views = {}
+    for rater_id, profile_id, score, comment, voted_at in votes:
+        views[(rater_id, profile_id)] = voted_at
+    view_insert = _insert(ProfileView.__table__)
+    view_upsert = view_insert.on_conflict_do_update(
+        index_elements=['viewer_id', 'profile_id'],
+        set_={'viewed_at': view_insert.excluded.viewed_at}
+    )
+    await connection.execute(view_upsert, [
+        {'viewer_id': viewer_id, 'profile_id': profile_id, 'viewed_at': viewed_at}
+        for (viewer_id, profile_id), viewed_at in views.items()
+    ])
+
+    if aggregates:
+        profiles = Profile.__table__
+        await connection.execute(
+            update(profiles)
+            .where(profiles.c.id == bindparam('b_profile_id'))
+            .values(
+                rating_count=profiles.c.rating_count + bindparam('b_count'),
+                rating_sum=profiles.c.rating_sum + bindparam('b_sum'),
+                version=profiles.c.version + 1
+            ),
+            [
+                {'b_profile_id': profile_id, 'b_count': count, 'b_sum': total}
+                for profile_id, (count, total) in aggregates.items()
+            ]
+        )
+    return inserted
+
+@timed
+async def record_vote(rater_id: int, profile_id: int, score: float, comment: str | None = None):
+    """Записывает голос: оценку, просмотр анкеты и агрегаты одной транзакцией.
+
+    В режиме VOTE_WRITE_BEHIND голос только кладется в буфер, а в базу попадает
+    пачкой при ближайшем сбросе.
+
+    Возвращает False, если пользователь уже оценил эту анкету (повторный колбэк кнопки).
+    В режиме VOTE_WRITE_BEHIND так распознаются только повторы, еще лежащие в буфере;
+    повтор уже записанного голоса отбросит сам INSERT при сбросе.
+    """
+    vote = (rater_id, profile_id, score, comment, datetime.now())
+    if VOTE_WRITE_BEHIND:
+        if (rater_id, profile_id) in _vote_pairs:
+            return False
+        _vote_buffer.append(vote)
+        _vote_pairs.add((rater_id, profile_id))
+        if len(_vote_buffer) >= VOTE_FLUSH_BATCH and _vote_flush_event is not None:
+            _vote_flush_event.set()
+        return True
+    return bool(await _write_votes_now([vote]))
+
+@_serialized_write
+async def _write_votes_now(votes):
+    async with async_session() as session:
+        inserted = await _write_votes(session, votes)
+        await session.commit()
+        return inserted
+
+_vote_buffer = []
+# Пары (пользователь, анкета) голосов из буфера — для отсева повторов до записи
+_vote_pairs = set()
+_vote_flush_event = None
+_vote_writer_task = None
+_vote_writer_stopping = False
+
+@timed
+async def flush_votes():
+    """Сбрасывает накопленные голоса в базу одной транзакцией"""
+    global _vote_buffer, _vote_pairs
+    if not _vote_buffer:
+        return 0
+    votes, _vote_buffer = _vote_buffer, []
+    pairs, _vote_pairs = _vote_pairs, set()
+    try:
+        await _write_votes_now(votes)
+    except BaseException as e:
+        # В том числе при отмене: пачка уже вынута из буфера, и без возврата голоса пропали бы.
+        # Если запись все же успела пройти, повторная вставка отсеется по (rater_id, profile_id)
+        logger.error(f"Ошибка при записи {len(votes)} голосов, вернули их в буфер: {e!r}")
+        _vote_buffer = votes + _vote_buffer
+        _vote_pairs |= pairs
+        raise
+    return len(votes)
+
+async def _vote_writer_loop():
+    while not _vote_writer_stopping:
+        try:
+            await asyncio.wait_for(_vote_flush_event.wait(), VOTE_FLUSH_INTERVAL_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        _vote_flush_event.clear()
+        try:
+            await flush_votes()
+        except Exception:
+            await asyncio.sleep(1)
+
+def start_vote_writer():
+    """Запускает фоновый сброс буфера голосов (только в режиме VOTE_WRITE_BEHIND)"""
+    global _vote_flush_event, _vote_writer_task, _vote_writer_stopping
+    if not VOTE_WRITE_BEHIND or _vote_writer_task is not None:
+        return
+    _vote_writer_stopping = False
+    _vote_flush_event = asyncio.Event()
+    _vote_writer_task = asyncio.create_task(_vote_writer_loop())
+    logger.info(f"Отложенная запись голосов включена: каждые {VOTE_FLUSH_INTERVAL_MS} мс или {VOTE_FLUSH_BATCH} голосов")
+
+async def stop_vote_writer():
+    """Останавливает фоновый сброс и дописывает оставшиеся голоса"""
+    global _vote_writer_task, _vote_writer_stopping
+    if _vote_writer_task is not None:
+        # Цикл останавливается флагом, а не cancel(): отмена посреди flush_votes()
+        # могла бы оборвать запись уже вынутой из буфера пачки
+        _vote_writer_stopping = True
+        _vote_flush_event.set()
+        await _vote_writer_task
+        _vote_writer_task = None
+    flushed = await flush_votes()
+    if flushed:
+        logger.info(f"При остановке записано {flushed} голосов из буфера")
+
+@_serialized_write
+async def _delete_expired_batch(now: datetime, batch_size: int):
+    """Удаляет одну пачку анкет с истекшим сроком вместе с их оценками и просмотрами"""
+    async with async_session() as session:
+        result = await session.execute(_expired_ids_query(now, batch_size))
+        expired_ids = result.scalars().all()
+        if not expired_ids:
+            return [], {}
+        ratings_result, views_result, profiles_result = [
+            await session.execute(statement) for statement in _delete_profiles_statements(expired_ids)
+        ]
         await session.commit()
-        return ex_profiles
+    removed = {
+        'profiles': profiles_result.rowcount,
+        'ratings': ratings_result.rowcount,
+        'views': views_result.rowcount,
+    }
+    return expired_ids, removed
+
+@timed
+async def delete_ex_profiles(batch_size: int = EXPIRY_BATCH_SIZE):
+    """Удаляет анкеты с истекшим сроком пачками по batch_size, каждая пачка — своя транзакция.
+
+    Возвращает статистику: сколько удалено анкет, оценок и просмотров и сколько это заняло секунд.
+    """
+    started = time.perf_counter()
+    stats = {'profiles': 0, 'ratings': 0, 'views': 0, 'batches': 0}
+    now = datetime.utcnow()
+    while True:
+        expired_ids, removed = await _delete_expired_batch(now, batch_size)
+        if not expired_ids:
+            break
+        for key, count in removed.items():
+            stats[key] += count
+        stats['batches'] += 1
+        _notify_profiles_changed(expired_ids)
+        if len(expired_ids) < batch_size:
+            break
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(
+        f"Удалены анкеты с истекшим сроком: {stats['profiles']} анкет, {stats['ratings']} оценок, "
+        f"{stats['views']} просмотров за {stats['seconds']} с ({stats['batches']} пачек)"
+    )
+    return stats
 
+@timed
 async def get_profile_info(profile_id: int):
     async with async_session() as session:
         result = await session.execute(
@@ -301,6 +862,8 @@ async def get_profile_info(profile_id: int):
             return profile.delete_at, days
         else:
             return None, False
+@timed
+@_serialized_write
 async def edit_profile(profile_id: int, description: str, category: str, video_id: str | None, photo_id: str | None): 
     async with async_session() as session:
         result = await session.execute(
@@ -322,90 +885,85 @@ async def edit_profile(profile_id: int, description: str, category: str, video_i
             profile.video_id = video_id
             profile.photo_id = photo_id
             profile.is_verified = False  # Сбрасываем статус верификации
+            profile.rating_count = 0
+            profile.rating_sum = 0
             profile.created_at = datetime.now()  # Обновляем время создания
+            profile.version += 1
             
             await session.commit()
             await session.refresh(profile)
+            _notify_profiles_changed([profile_id])
             return profile
         return None
     
+@timed
+@_serialized_write
 async def delete_profile(profile_id: int):
     async with async_session() as session:
         result = await session.execute(
-            select(Profile).options(
-                selectinload(Profile.user),
-                selectinload(Profile.received_ratings)
-            ).where(Profile.id == profile_id)
+            select(Profile.user_id).where(Profile.id == profile_id)
         )
-        profile = result.scalars().first()
-        if profile:
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-            
-            # Удаляем все связанные записи
-            await session.execute(
-                delete(Rating).where(Rating.profile_id == profile_id)
-            )
-            await session.execute(
-                delete(ProfileView).where(ProfileView.profile_id == profile_id)
-            )
-            # Также удаляем записи, где пользователь является просматривающим
-            await session.execute(
-                delete(ProfileView).where(ProfileView.viewer_id == profile.user_id)
-            )
-            
-            # Удаляем все оценки, которые пользователь поставил другим анкетам
-            await session.execute(
-                delete(Rating).where(Rating.rater_id == profile.user_id)
+        user_id = result.scalar_one_or_none()
+        if user_id is not None:
+            # Анкеты, которые оценивал пользователь: их агрегаты нужно будет пересчитать
+            rated_result = await session.execute(
+                select(Rating.profile_id).where(Rating.rater_id == user_id).distinct()
             )
+            rated_profile_ids = [row[0] for row in rated_result.fetchall() if row[0] != profile_id]
+
+            # Удаляем просмотры и оценки, которые оставил пользователь, —
+            # затем пересчитываем агрегаты задетых анкет
+            for statement in _delete_user_activity_statements(user_id):
+                await session.execute(statement)
+            if rated_profile_ids:
+                await session.execute(_rating_aggregates_update(rated_profile_ids))
             
-            await session.delete(profile)
+            # Удаляем саму анкету вместе с ее оценками и просмотрами
+            for statement in _delete_profiles_statements([profile_id]):
+                await session.execute(statement)
             # Не удаляем пользователя, чтобы избежать проблем с foreign key constraints
             # await session.delete(profile.user)
             await session.commit()
+            _notify_profiles_changed([profile_id])
             return True
         return False
     
+@timed
 async def get_user_profile_with_rating(telegram_id: int):
     async with async_session() as session:
-        user_result = await session.execute(
-            select(User).options(
-                selectinload(User.profiles).selectinload(Profile.received_ratings)
-            ).where(User.telegram_id == telegram_id)
+        # Последняя (самая новая) анкета пользователя
+        result = await session.execute(
+            _card_query()
+            .where(User.telegram_id == telegram_id)
+            .order_by(Profile.created_at.desc())
+            .limit(1)
         )
-        user = user_result.scalar_one_or_none()
-        if not user:
-            logger.info(f"Пользователь не найден: telegram_id={telegram_id}")
-            return None
-        
-        if user.profiles:
-            # Возвращаем последний профиль (самый новый)
-            latest_profile = max(user.profiles, key=lambda p: p.created_at)
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(latest_profile, attribute_names=['received_ratings'])
-            return latest_profile
-        
-        return None
+        profile = _card(result)
+        if profile is None:
+            logger.info(f"Анкета не найдена: telegram_id={telegram_id}")
+        return profile
 
+@timed
+@_serialized_write
 async def verify_profile(profile_id: int):
     async with async_session() as session:
         result = await session.execute(
-            select(Profile).options(
-                selectinload(Profile.user),
-                selectinload(Profile.received_ratings)
-            ).where(Profile.id == profile_id)
+            select(User.telegram_id, User.username)
+            .join(Profile, Profile.user_id == User.id)
+            .where(Profile.id == profile_id)
         )
-        profile = result.scalars().first()
-        if profile:
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-            user_telegram_id = profile.user.telegram_id
-            user_username = profile.user.username
-            profile.is_verified = True
+        row = result.first()
+        if row is not None:
+            await session.execute(
+                update(Profile).where(Profile.id == profile_id).values(is_verified=True, version=Profile.version + 1)
+            )
             await session.commit()
-            return {'id': profile.id, 'telegram_id': user_telegram_id, 'username': user_username}
+            _notify_profiles_changed([profile_id])
+            return {'id': profile_id, 'telegram_id': row.telegram_id, 'username': row.username}
         return None
 
+@timed
+@_serialized_write
 async def reject_profile(profile_id: int):
     async with async_session() as session:
         result = await session.execute(
@@ -415,120 +973,118 @@ async def reject_profile(profile_id: int):
         if profile and not profile.is_verified:
             await session.delete(profile)
             await session.commit()
+            _notify_profiles_changed([profile_id])
             return True
         return False
 
+@timed
 async def get_need_profiles():
     async with async_session() as session:
         result = await session.execute(
-            select(Profile).options(
-                selectinload(Profile.user),
-                selectinload(Profile.received_ratings)
-            ).where(Profile.is_verified == False)
+            _card_query().where(Profile.is_verified == False).order_by(Profile.created_at, Profile.id)
         )
-        profiles = result.scalars().all()
-        # Принудительно загружаем связанные данные для всех профилей
-        for profile in profiles:
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-        return profiles
+        return _cards(result)
 
-async def get_profile_for_moderation(profile_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Profile).options(
-                selectinload(Profile.user),
-                selectinload(Profile.received_ratings)
-            ).where(Profile.id == profile_id)
-        )
-        profile = result.scalars().first()
-        if profile:
-            # Принудительно загружаем связанные данные в рамках текущей сессии
-            await session.refresh(profile, attribute_names=['user', 'received_ratings'])
-        return profile
+def _pending_after(cursor):
+    """Условие "анкета на модерации идет после курсора (created_at, id)" для keyset-пагинации"""
+    condition = Profile.is_verified == False
+    if cursor is None:
+        return condition
+    created_at, profile_id = cursor
+    # Отдельное условие created_at >= ... позволяет начать поиск по индексу прямо с курсора
+    return and_(
+        condition,
+        Profile.created_at >= created_at,
+        or_(Profile.created_at > created_at, Profile.id > profile_id),
+    )
 
-async def get_unviewed_profiles_count(viewer_telegram_id: int):
+@timed
+async def get_pending_profiles_count(cursor: tuple[datetime, int] | None = None):
+    """Сколько анкет ждут модерации (после курсора, если он задан)"""
     async with async_session() as session:
-        # Получаем ID пользователя
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == viewer_telegram_id)
-        )
-        user = user_result.scalar_one_or_none()
+        result = await session.execute(_pending_count_query(cursor))
+        return result.scalar()
 
-        if not user:
-            return False
+@timed
+async def get_next_pending_profile(cursor: tuple[datetime, int] | None = None):
+    """Следующая анкета на модерации после курсора (created_at, id) — только поля карточки модерации"""
+    async with async_session() as session:
+        result = await session.execute(_next_pending_query(cursor))
+        return result.first()
 
-        # Получаем ID просмотренных анкет
-        viewed_profiles_result = await session.execute(
-            select(ProfileView.profile_id).where(ProfileView.viewer_id == user.id)
-        )
-        viewed_profile_ids = [row[0] for row in viewed_profiles_result.fetchall()]
+@timed
+async def get_profile_for_moderation(profile_id: int):
+    async with async_session() as session:
+        result = await session.execute(_card_query().where(Profile.id == profile_id))
+        return _card(result)
 
+@timed
+async def get_unviewed_profiles_count(viewer_telegram_id: int, user_id: int | None = None):
+    # Получаем ID пользователя
+    user_id = await _resolve_user_id(viewer_telegram_id, user_id)
+    if user_id is None:
+        return False
+    async with async_session() as session:
         # Подсчитываем непросмотренные анкеты
-        query = select(func.count(Profile.id)).where(
-            and_(
-                Profile.is_verified == True,
-                Profile.user_id != user.id,
-                ~Profile.id.in_(viewed_profile_ids) if viewed_profile_ids else True
-            )
-        )
-
-        result = await session.execute(query)
+        result = await session.execute(_unviewed_count_query(user_id))
         return result.scalar()
 
+# Правила определения победителя: минимум оценок и "зона равенства" средних оценок
+WINNER_MIN_VOTES = 5
+WINNER_MARGIN = 0.3
+
+@timed
 async def get_winner_profile():
     async with async_session() as session:
-        result = await session.execute(
-            select(Profile)
-            .options(selectinload(Profile.user), selectinload(Profile.received_ratings))
-            .where(Profile.is_verified == True)
+        # Сначала пробуем строгие правила (>=5 оценок и разница в 0.3).
+        # Правило зависит от порядка обхода, поэтому база отдает только узкую
+        # проекцию агрегатов в порядке id, а сравнение идет потоково
+        result = await session.stream(
+            select(Profile.id, Profile.rating_count, Profile.rating_sum)
+            .where(Profile.is_verified == True, Profile.rating_count >= WINNER_MIN_VOTES)
+            .order_by(Profile.id)
         )
-        profiles = result.scalars().all()
-        if not profiles:
-            return None
-
-        # Сначала пробуем строгие правила (>=5 оценок и разница в 0.3)
-        winner = None
+        winner_id = None
         max_avg = -1.0
         max_count = -1
-        for profile in profiles:
-            ratings = profile.received_ratings or []
-            count = len(ratings)
-            if count < 5:
-                continue
-            avg = sum(r.score for r in ratings) / count if ratings else 0
-            if avg > max_avg + 0.3:
-                winner = profile
+        async for profile_id, count, rating_sum in result:
+            avg = rating_sum / count
+            if avg > max_avg + WINNER_MARGIN:
+                winner_id = profile_id
                 max_avg = avg
                 max_count = count
-            elif abs(avg - max_avg) <= 0.3:
+            elif abs(avg - max_avg) <= WINNER_MARGIN:
                 if count > max_count:
-                    winner = profile
+                    winner_id = profile_id
                     max_avg = avg
                     max_count = count
 
-        if winner:
-            return winner
-
-        # Fallback: если нет профилей с >=5 оценками, выбираем лучшего из тех, у кого >=1
-        fallback_winner = None
-        fallback_max_avg = -1.0
-        fallback_max_count = -1
-        for profile in profiles:
-            ratings = profile.received_ratings or []
-            count = len(ratings)
-            if count == 0:
-                continue
-            avg = sum(r.score for r in ratings) / count
-            if avg > fallback_max_avg:
-                fallback_winner = profile
-                fallback_max_avg = avg
-                fallback_max_count = count
-            elif abs(avg - fallback_max_avg) < 1e-9:
-                if count > fallback_max_count:
-                    fallback_winner = profile
-                    fallback_max_avg = avg
-                    fallback_max_count = count
-        return fallback_winner
+        if winner_id is None:
+            # Fallback: если нет профилей с >=5 оценками, выбираем лучшего из тех, у кого >=1
+            result = await session.execute(
+                select(Profile.id)
+                .where(Profile.is_verified == True, Profile.rating_count > 0)
+                .order_by(Profile.avg_rating.desc(), Profile.rating_count.desc(), Profile.id)
+                .limit(1)
+            )
+            winner_id = result.scalar_one_or_none()
+            if winner_id is None:
+                return None
+
+        result = await session.execute(_card_query().where(Profile.id == winner_id))
+        return _card(result)
+
+@timed
+async def get_leaderboard(limit: int = 10, min_votes: int = 1):
+    """Топ-K одобренных анкет по средней оценке, при равенстве — по количеству оценок"""
+    async with async_session() as session:
+        result = await session.execute(
+            _card_query()
+            .where(Profile.is_verified == True, Profile.rating_count >= min_votes)
+            .order_by(Profile.avg_rating.desc(), Profile.rating_count.desc(), Profile.id)
+            .limit(limit)
+        )
+        return _cards(result)
 
 async def periodic_delete():
     while True:
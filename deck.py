@@ -0,0 +1,142 @@
+from collections import OrderedDict, deque
+from database import get_random_profiles_by_category, add_profile_listener
+import asyncio
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Сколько анкет держать наготове для пользователя и сколько они живут в памяти
+DECK_SIZE = int(os.getenv('DECK_SIZE', '5'))
+DECK_TTL = float(os.getenv('DECK_TTL', '120'))
+DECK_MAX_USERS = int(os.getenv('DECK_MAX_USERS', '10000'))
+
+
+class _Deck:
+    __slots__ = ('cards', 'issued', 'expires_at', 'refill_task')
+
+    def __init__(self, size: int, ttl: float):
+        self.cards = deque()
+        # Выданные, но еще не оцененные анкеты: их нельзя подгружать повторно
+        self.issued = deque(maxlen=size * 2)
+        self.expires_at = time.monotonic() + ttl
+        self.refill_task = None
+
+
+class CandidateDeck:
+    """Колода заранее загруженных анкет для оценивания: отдельная на пару (пользователь, категория).
+
+    Следующая анкета обычно берется из памяти, а колода добирается в фоне, когда в ней
+    остается мало карточек. Удаленные, отклоненные и измененные анкеты выбрасываются
+    из всех колод по событию из database.
+    """
+
+    def __init__(self, size: int = DECK_SIZE, ttl: float = DECK_TTL, max_users: int = DECK_MAX_USERS):
+        self.size = size
+        self.ttl = ttl
+        self.max_users = max_users
+        self.low_water = max(1, size // 2)
+        self._decks = OrderedDict()
+        # Недавно выброшенные анкеты и время выброса: запрос, начатый раньше выброса,
+        # не должен вернуть их обратно в колоду
+        self._dropped = {}
+
+    async def next_profile(self, telegram_id: int, category: str = None):
+        """Следующая анкета для оценивания или None, если подходящих анкет не осталось"""
+        key = (telegram_id, category or "Все")
+        deck = self._decks.get(key)
+        if deck is not None and deck.expires_at < time.monotonic():
+            self._remove(key)
+            deck = None
+
+        if deck is not None and deck.cards:
+            self._decks.move_to_end(key)
+            profile = deck.cards.popleft()
+            deck.issued.append(profile.id)
+            if len(deck.cards) < self.low_water:
+                self._schedule_refill(key, deck)
+            return profile
+
+        # Колоды нет или она пуста — загружаем синхронно
+        if deck is None:
+            deck = self._create(key)
+        profiles = await self._fetch(key, deck, self.size + 1)
+        if not profiles:
+            return None
+        profile = profiles[0]
+        deck.issued.append(profile.id)
+        # Пока шел запрос, фоновая дозагрузка могла положить в колоду те же анкеты
+        if any(card.id == profile.id for card in deck.cards):
+            deck.cards = deque(card for card in deck.cards if card.id != profile.id)
+        known_ids = {card.id for card in deck.cards} | set(deck.issued)
+        deck.cards.extend(card for card in profiles[1:] if card.id not in known_ids)
+        return profile
+
+    def discard_profiles(self, profile_ids):
+        """Убирает анкеты из всех колод (вызывается при удалении, отклонении и правке)"""
+        ids = set(profile_ids)
+        now = time.monotonic()
+        for profile_id in ids:
+            self._dropped[profile_id] = now
+        for deck in self._decks.values():
+            if any(profile.id in ids for profile in deck.cards):
+                deck.cards = deque(profile for profile in deck.cards if profile.id not in ids)
+
+    def discard_for_user(self, telegram_id: int, profile_id: int):
+        """Убирает оцененную анкету из всех колод пользователя, в том числе других категорий"""
+        for key, deck in self._decks.items():
+            if key[0] != telegram_id:
+                continue
+            # В выданные — чтобы ее не вернула дозагрузка, начатая до оценки
+            if profile_id not in deck.issued:
+                deck.issued.append(profile_id)
+            if any(profile.id == profile_id for profile in deck.cards):
+                deck.cards = deque(profile for profile in deck.cards if profile.id != profile_id)
+
+    def reset_user(self, telegram_id: int):
+        """Сбрасывает все колоды пользователя"""
+        for key in [key for key in self._decks if key[0] == telegram_id]:
+            self._remove(key)
+
+    def _create(self, key):
+        deck = _Deck(self.size, self.ttl)
+        self._decks[key] = deck
+        while len(self._decks) > self.max_users:
+            self._remove(next(iter(self._decks)))
+        return deck
+
+    def _remove(self, key):
+        deck = self._decks.pop(key, None)
+        if deck is not None and deck.refill_task is not None:
+            deck.refill_task.cancel()
+
+    async def _fetch(self, key, deck, limit: int):
+        telegram_id, category = key
+        exclude_ids = {profile.id for profile in deck.cards} | set(deck.issued)
+        started = time.monotonic()
+        profiles = await get_random_profiles_by_category(telegram_id, category, limit, exclude_ids)
+        # Запросы, начатые после выброса, уже видят актуальное состояние базы (например, только что
+        # одобренную анкету), поэтому отсекаем только то, что выбросили, пока шел этот запрос
+        self._dropped = {profile_id: t for profile_id, t in self._dropped.items() if t > started - self.ttl}
+        return [profile for profile in profiles if self._dropped.get(profile.id, float('-inf')) < started]
+
+    def _schedule_refill(self, key, deck):
+        if deck.refill_task is not None and not deck.refill_task.done():
+            return
+        deck.refill_task = asyncio.create_task(self._refill(key, deck))
+
+    async def _refill(self, key, deck):
+        try:
+            profiles = await self._fetch(key, deck, self.size - len(deck.cards))
+        except Exception as e:
+            logger.error(f"Ошибка при дозагрузке колоды {key}: {e}")
+            return
+        # Колода могла быть вытеснена или сброшена, пока шел запрос
+        if self._decks.get(key) is deck:
+            known_ids = {profile.id for profile in deck.cards} | set(deck.issued)
+            deck.cards.extend(profile for profile in profiles if profile.id not in known_ids)
+
+
+candidate_deck = CandidateDeck()
+add_profile_listener(candidate_deck.discard_profiles)
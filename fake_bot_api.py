@@ -0,0 +1,202 @@
+"""Локальная замена Bot API для тестов вебхука и нагрузочных прогонов.
+
+Сервер отвечает на вызовы бота (sendMessage, sendPhoto, answerCallbackQuery и т.д.)
+правдоподобными ответами и запоминает их, а send_updates() шлет боту обновления
+так же, как это делает Telegram. Бот направляется сюда переменной BOT_API_URL.
+
+Запуск: python fake_bot_api.py --port 8081 [--webhook http://127.0.0.1:8080/webhook --updates 1000]
+"""
+from aiohttp import web, ClientSession, ClientTimeout
+from collections import Counter
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+BOT_ID = 1000000001
+_MEDIA_FIELDS = {
+    'sendPhoto': 'photo',
+    'sendVideo': 'video',
+    'sendDocument': 'document',
+}
+
+
+class FakeBotAPI:
+    """Стенд Bot API: принимает запросы вида /bot<token>/<method> и ведет их учет"""
+
+    def __init__(self, latency: float = 0.0):
+        # Искусственная задержка ответа, чтобы приблизить замеры к настоящему Telegram
+        self.latency = latency
+        self.calls = Counter()
+        self.requests = []
+        self.keep_requests = False
+        # Последнее отправленное или отредактированное сообщение в каждом чате — чтобы нажимать его кнопки
+        self.last_messages = {}
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081) -> web.AppRunner:
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.keep_requests:
+            self.requests.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    def _result(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Fake bot', 'username': 'fake_bot'}
+        if method == 'getUpdates':
+            return []
+        if method.startswith('send') or method.startswith('edit'):
+            return self._message(method, params)
+        # setWebhook, deleteWebhook, answerCallbackQuery, deleteMessage и прочее
+        return True
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Fake bot'},
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        field = _MEDIA_FIELDS.get(method)
+        file_id = params.get(field)
+        if method == 'editMessageMedia':
+            # Новое медиа приходит JSON-объектом InputMedia
+            media = json.loads(params['media'])
+            field, file_id = media['type'], media['media']
+            if 'caption' in media:
+                message['caption'] = media['caption']
+        if field == 'photo':
+            message['photo'] = [{'file_id': str(file_id), 'file_unique_id': 'p', 'width': 1, 'height': 1}]
+        elif field == 'video':
+            message['video'] = {'file_id': str(file_id), 'file_unique_id': 'v', 'width': 1, 'height': 1, 'duration': 1}
+        elif field == 'document':
+            message['document'] = {'file_id': str(file_id), 'file_unique_id': 'd'}
+        if 'reply_markup' in params:
+            markup = json.loads(params['reply_markup'])
+            # В сообщении Telegram возвращает только inline-клавиатуру
+            if 'inline_keyboard' in markup:
+                message['reply_markup'] = markup
+        self.last_messages[chat_id] = message
+        return message
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Обновление с текстовым сообщением от пользователя"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str, message: dict | None = None) -> dict:
+    """Обновление с нажатием inline-кнопки под сообщением бота. message — сообщение, под которым
+    нажата кнопка (например, ответ стенда на sendPhoto); по умолчанию текстовое"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': message or {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Fake bot'},
+                'text': '...',
+            },
+        },
+    }
+
+
+async def send_updates(webhook_url: str, updates, concurrency: int = 50, secret: str | None = None) -> list[float]:
+    """Отправляет обновления на вебхук, как Telegram, и возвращает время ответа на каждое, в секундах"""
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def post(session, update):
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(webhook_url, data=json.dumps(update), headers=headers) as response:
+                await response.read()
+                response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+
+    async with ClientSession(timeout=ClientTimeout(total=60)) as session:
+        await asyncio.gather(*(post(session, update) for update in updates))
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа Bot API, с')
+    parser.add_argument('--webhook', help='адрес вебхука бота, на который слать обновления')
+    parser.add_argument('--secret', help='секрет вебхука (WEBHOOK_SECRET)')
+    parser.add_argument('--updates', type=int, default=0, help='сколько обновлений отправить')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency)
+    runner = await api.start(args.host, args.port)
+    print(f"Bot API: http://{args.host}:{args.port} (BOT_API_URL)")
+    try:
+        if args.webhook and args.updates:
+            updates = [
+                message_update(api.next_update_id(), random.randint(1, args.users), '👥 Оценить анкеты')
+                for _ in range(args.updates)
+            ]
+            started = time.perf_counter()
+            timings = sorted(await send_updates(args.webhook, updates, args.concurrency, args.secret))
+            elapsed = time.perf_counter() - started
+            print(f"Отправлено {len(timings)} обновлений за {elapsed:.2f} с ({len(timings) / elapsed:.0f}/с), "
+                  f"p50={timings[len(timings) // 2] * 1000:.1f} мс, p99={timings[int(len(timings) * 0.99)] * 1000:.1f} мс")
+            # Даем боту дообработать фоновые обновления перед выводом счетчиков
+            await asyncio.sleep(1)
+            print(f"Вызовы Bot API: {dict(api.calls)}")
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
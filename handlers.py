@@ -1,5 +1,6 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
+from aiogram.methods import SendMessage
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -7,18 +8,26 @@ import asyncio
 import logging
 from datetime import datetime
 from keyboards import (
-    get_main_keyboard, get_rating_keyboard, get_profile_verification_keyboard,
-    get_profile_edit, get_moderation_keyboard, get_moderation_profile,
+    get_main_keyboard, get_moderation_keyboard,
     get_category_selection_keyboard
 )
 from database import (
-    get_user, create_user, create_profile, get_random_profile,
-    create_rating, delete_ex_profiles, get_profile_info, get_user_profile,
+    get_user_id, create_user, create_profile, get_random_profile,
+    record_vote, delete_ex_profiles, get_profile_info, get_user_profile,
     edit_profile, delete_profile, get_user_profile_with_rating,
-    verify_profile, reject_profile, get_need_profiles, get_profile_for_moderation,
-    verify_profile, reject_profile, mark_profile_as_viewed,
+    verify_profile, reject_profile, get_next_pending_profile, get_pending_profiles_count,
+    get_profile_for_moderation,
+    verify_profile, reject_profile,
     get_unviewed_profiles_count, get_winner_profile,
-    get_random_profile_by_category, get_available_categories
+    get_available_categories, get_category_counts
+)
+from deck import candidate_deck
+from sender import outbound, PRIORITY_VERDICT
+from notifications import admin_notifier
+from metrics import HandlerTimingMiddleware
+from rendering import (
+    get_display_username, render_card, answer_card, replace_card,
+    VIEW_RATING, VIEW_OWN, VIEW_MODERATION, VIEW_WINNER
 )
 from typing import Callable, Awaitable
 import time
@@ -45,29 +54,14 @@ import time
 
 logger = logging.getLogger(__name__)
 router = Router()
+router.message.middleware(HandlerTimingMiddleware())
+router.callback_query.middleware(HandlerTimingMiddleware())
 
-def get_display_username(username: str | None) -> str:
-    """Безопасно получает username для отображения"""
-    if username:
-        return f"@{username}"
-    return "Пользователь без username"
-
-# Telegram ограничения: caption до ~1024 символов, текст до ~4096
-CAPTION_LIMIT = 1000
-TEXT_LIMIT = 4000
-
-def truncate_text(text: str, max_length: int) -> str:
-    if not text:
-        return ""
-    if len(text) <= max_length:
-        return text
-    return text[: max_length - 3] + "..."
-
-def build_profile_text_for_caption(lines: list[str], for_caption: bool = True) -> str:
-    # Склеиваем строки и обрезаем под лимит
-    text = "".join(lines)
-    limit = CAPTION_LIMIT if for_caption else TEXT_LIMIT
-    return truncate_text(text, limit)
+def format_categories(counts: dict) -> str:
+    """Список категорий с количеством анкет для меню выбора"""
+    lines = [f"• Все ({sum(counts.values())})"]
+    lines += [f"• {category} ({counts[category]})" for category in sorted(counts)]
+    return "\n".join(lines)
 
 class ProfileStates(StatesGroup):
     waiting_for_description = State()
@@ -88,36 +82,17 @@ class ModerationStates(StatesGroup):
 class ProfileViewStates(StatesGroup):
     view_profiles = State()
 
-async def show_profile_for_moderation(message: Message, profile_id):
-    profile = await get_profile_for_moderation(profile_id)
-    if not profile or not profile.user:
-        await message.answer("⚠️ Ошибка: не удалось загрузить данные анкеты.")
-        return
-    
-    profile_text = (
-        f"📝 Анкета на модерацию:\n\n"
-        f"👤 Пользователь: {get_display_username(profile.user.username)}\n"
-        f"📝 Описание: {profile.description}\n"
-        f"✨ Категория: {profile.category}\n"
-        f"📅 Создана: {profile.created_at.strftime('%d.%m.%Y %H:%M') if profile.created_at else 'неизвестно'}"
-    )
-    if profile.video_id:
-        await message.answer_video(
-            video=profile.video_id,
-            caption=profile_text,
-            reply_markup=get_moderation_profile(profile.id)
-        )
-    elif profile.photo_id:
-        await message.answer_photo(
-            photo=profile.photo_id,
-            caption=profile_text,
-            reply_markup=get_moderation_profile(profile.id)
-        )
-    else:
-        await message.answer(
-            profile_text,
-            reply_markup=get_moderation_profile(profile.id)
-        )
+def moderation_cursor(profile) -> list:
+    """Курсор модерации для состояния FSM: (created_at, id) последней показанной анкеты"""
+    return [profile.created_at.isoformat(), profile.id]
+
+def parse_moderation_cursor(cursor):
+    return (datetime.fromisoformat(cursor[0]), cursor[1]) if cursor else None
+
+async def show_profile_for_moderation(message: Message, profile):
+    # Сколько анкет останется в очереди после этой
+    remaining = await get_pending_profiles_count((profile.created_at, profile.id))
+    await answer_card(message, render_card(profile, VIEW_MODERATION, f"\n⏳ Осталось в очереди: {remaining}"))
 
 async def next_profile(callback: CallbackQuery, state: FSMContext):#moderation
     if callback.from_user.id != 1653541807:
@@ -128,9 +103,9 @@ async def next_profile(callback: CallbackQuery, state: FSMContext):#moderation
         await callback.answer("Ошибка: данные не найдены")
         return
 
-    profiles = data['profiles']
-    current_index = data['current_index']
-    if current_index >= len(profiles)-1:
+    # В состоянии хранится только курсор — (created_at, id) последней показанной анкеты
+    profile = await get_next_pending_profile(parse_moderation_cursor(data.get('moderation_cursor')))
+    if profile is None:
         await callback.answer("❗️ Это последняя анкета")
         await state.clear()
         await callback.message.answer(
@@ -139,27 +114,24 @@ async def next_profile(callback: CallbackQuery, state: FSMContext):#moderation
             reply_markup=get_moderation_keyboard()
         )
         return
-    current_index += 1
-    await state.update_data(current_index=current_index)
-    profile_id = profiles[current_index]
+    await state.update_data(moderation_cursor=moderation_cursor(profile))
     await callback.message.delete()
-    await show_profile_for_moderation(callback.message, profile_id)
+    await show_profile_for_moderation(callback.message, profile)
 
 async def show_next_profile(message: Message, state: FSMContext, user_id: int = None):#clients
     # Определяем ID пользователя (переданный или из сообщения)
     telegram_id = user_id if user_id is not None else message.from_user.id
-    is_admin = telegram_id == 1653541807
     
     # Отладочная информация
-    print(f"DEBUG: show_next_profile вызвана для пользователя {telegram_id}")
+    logger.debug(f"show_next_profile вызвана для пользователя {telegram_id}")
     
     # Получаем выбранную категорию из состояния
     data = await state.get_data()
     selected_category = data.get('selected_category', 'Все')
     
-    profile = await get_random_profile_by_category(telegram_id, selected_category)
+    profile = await candidate_deck.next_profile(telegram_id, selected_category)
     if not profile:
-        print(f"DEBUG: get_random_profile вернул None для пользователя {telegram_id}")
+        logger.debug(f"get_random_profile вернул None для пользователя {telegram_id}")
         categories = await get_available_categories()
         await message.answer(
             f"😔 К сожалению, в категории '{selected_category}' больше нет доступных анкет для оценки.\n"
@@ -168,52 +140,11 @@ async def show_next_profile(message: Message, state: FSMContext, user_id: int =
         )
         await state.set_state(RatingStates.waiting_for_category_selection)
         return
-    if not profile.user:
-        print(f"DEBUG: profile.user равен None для profile_id {profile.id}")
-        await message.answer(
-            "⚠️ Ошибка: не удалось загрузить данные пользователя.",
-            reply_markup=get_main_keyboard(is_admin=is_admin)
-        )
-        await state.clear()
-        return
-
-    print(f"DEBUG: Найдена анкета profile_id={profile.id}, user_id={profile.user_id}, username={get_display_username(profile.user.username)}")
+    logger.debug(f"Найдена анкета profile_id={profile.id}, user_id={profile.user_id}, username={get_display_username(profile.username)}")
 
     await state.set_state(ProfileViewStates.view_profiles)
     await state.update_data(current_profile_id=profile.id)
-    
-    # Безопасно обрабатываем рейтинги
-    ratings = profile.received_ratings
-    if not ratings:
-        ratings = []
-    elif not isinstance(ratings, list):
-        ratings = [ratings]
-    avg_rating = round(sum(r.score for r in ratings) / len(ratings), 2) if ratings else 0
-    
-    profile_text = build_profile_text_for_caption([
-        f"👤 Анкета пользователя {get_display_username(profile.user.username)}\n\n",
-        f"📝 Описание: {profile.description}\n",
-        f"✨ Категория: {profile.category}\n",
-        f"⭐️ Средняя оценка: {avg_rating}\n",
-        f"📊 Количество оценок: {len(ratings)}"
-    ], for_caption=True)
-    if profile.video_id:
-        await message.answer_video(
-            video=profile.video_id,
-            caption=profile_text,
-            reply_markup=get_rating_keyboard()
-        )
-    elif profile.photo_id:
-        await message.answer_photo(
-            photo=profile.photo_id,
-            caption=profile_text,
-            reply_markup=get_rating_keyboard()
-        )
-    else:
-        await message.answer(
-            profile_text,
-            reply_markup=get_rating_keyboard()
-        )
+    await answer_card(message, render_card(profile, VIEW_RATING))
 
 @router.message(Command('start'))
 async def start(message: Message):
@@ -221,9 +152,8 @@ async def start(message: Message):
         is_admin=True
     else:
         is_admin=False
-    user = await get_user(message.from_user.id)
-    if not user: # Новый пользователь без анкеты
-        user = await create_user(message.from_user.id, message.from_user.username)
+    if await get_user_id(message.from_user.id) is None: # Новый пользователь без анкеты
+        await create_user(message.from_user.id, message.from_user.username)
     welcome = (
         "Добро пожаловать в бот анкет! 🎉\n"
         "Вы можете создать свою анкету или оценивать анкеты других пользователей.\n"
@@ -294,9 +224,9 @@ async def process_video(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    user = await get_user(message.from_user.id)
-    if not user:
-        user = await create_user(message.from_user.id, message.from_user.username)
+    user_id = await get_user_id(message.from_user.id)
+    if user_id is None:
+        user_id = (await create_user(message.from_user.id, message.from_user.username)).id
     
     video = message.video
     if not video:
@@ -323,7 +253,7 @@ async def process_video(message: Message, state: FSMContext, bot: Bot):
         return
 
     profile = await create_profile(
-        user_id=user.id,
+        user_id=user_id,
         description=data['description'],
         category=data['category'],
         video_id=video_id,
@@ -352,7 +282,7 @@ async def process_video(message: Message, state: FSMContext, bot: Bot):
             f"✨ Категория: {profile.category}\n"
             f"📅 Создана: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
         )
-        await bot.send_video(chat_id='1653541807',video=video_id,caption=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message, video_id=video_id)
     else:
         await message.answer(
             "⚠️ Произошла ошибка при создании анкеты. Пожалуйста, попробуйте позже",
@@ -375,9 +305,9 @@ async def process_photo(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    user = await get_user(message.from_user.id)
-    if not user:
-        user = await create_user(message.from_user.id, message.from_user.username)
+    user_id = await get_user_id(message.from_user.id)
+    if user_id is None:
+        user_id = (await create_user(message.from_user.id, message.from_user.username)).id
     
     photo = message.photo[-1]
     if not photo:
@@ -396,7 +326,7 @@ async def process_photo(message: Message, state: FSMContext, bot: Bot):
         return
 
     profile = await create_profile(
-        user_id=user.id,
+        user_id=user_id,
         description=data['description'],
         category=data['category'],
         video_id=None,
@@ -425,7 +355,7 @@ async def process_photo(message: Message, state: FSMContext, bot: Bot):
             f"✨ Категория: {profile.category}\n"
             f"📅 Создана: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
         )
-        await bot.send_photo(chat_id='1653541807', photo=photo_id, caption=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message, photo_id=photo_id)
     else:
         await message.answer(
             "⚠️ Произошла ошибка при создании анкеты. Пожалуйста, попробуйте позже",
@@ -444,12 +374,12 @@ async def process_skip_media(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    user = await get_user(message.from_user.id)
-    if not user:
-        user = await create_user(message.from_user.id, message.from_user.username)
+    user_id = await get_user_id(message.from_user.id)
+    if user_id is None:
+        user_id = (await create_user(message.from_user.id, message.from_user.username)).id
     
     profile = await create_profile(
-        user_id=user.id,
+        user_id=user_id,
         description=data['description'],
         category=data['category'],
         video_id=None,
@@ -478,7 +408,7 @@ async def process_skip_media(message: Message, state: FSMContext, bot: Bot):
             f"✨ Категория: {profile.category}\n"
             f"📅 Создана: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
         )
-        await bot.send_message(chat_id='1653541807', text=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message)
     else:
         await message.answer(
             "⚠️ Произошла ошибка при создании анкеты. Пожалуйста, попробуйте позже",
@@ -495,52 +425,24 @@ async def show_profile(message: Message):
         is_admin=True
     else:
         is_admin=False
-    user = await get_user(message.from_user.id)
+    user_id = await get_user_id(message.from_user.id)
     profile = await get_user_profile(message.from_user.id)
-    if not profile or not user:
+    if not profile or user_id is None:
         await message.answer(
             "⚠️ У вас пока нет анкеты.\n"
             "Создайте её, нажав кнопку '📝 Создать анкету'",
             reply_markup=get_main_keyboard(is_admin=is_admin)
         )
         return
-    
-    # Проверяем, что связанные данные загружены
-    if not profile.user:
-        await message.answer(
-            "⚠️ Ошибка: не удалось загрузить данные пользователя",
-            reply_markup=get_main_keyboard(is_admin=is_admin)
-        )
-        return
-    
-    delete_at, days = await get_profile_info(profile.id)
-    ratings = profile.received_ratings
-    if not ratings:
-        ratings = []
-    elif not isinstance(ratings, list):
-        ratings = [ratings]
-    avg_rating = sum(r.score for r in ratings)/len(ratings) if ratings else 0
-    status_text = "✅ Одобрена" if profile.is_verified else "⏳ На модерации"
-    profile_text = (
-        f"👤 Ваша анкета: {get_display_username(profile.user.username)}\n"
-        f"📝 Описание: {profile.description}\n"
-        f"✨ Категория: {profile.category}\n"
-        f"⭐️ Средняя оценка: {round(avg_rating, 1)}\n"
-        f"📈 Количество оценок: {len(ratings)}\n"
-        f"⏳ Дней до удаления: {days}\n"
-        f"🗓 Дата удаления: {delete_at.strftime('%d.%m.%Y %H:%M') if delete_at else 'неизвестно'}"
-    )
 
-    if profile.video_id and profile.video_id.strip():
-        await message.answer_video(video=profile.video_id, caption=profile_text, reply_markup=get_profile_edit())
-    elif profile.photo_id and profile.photo_id.strip():
-        await message.answer_photo(photo=profile.photo_id, caption=profile_text, reply_markup=get_profile_edit())
-    else:
-        logger.info("Нет медиафайлов для отправки, отправляем только текст")
-        await message.answer(
-            profile_text,
-            reply_markup=get_profile_edit()
-        )
+    # Дата удаления уже есть в карточке — отдельный запрос не нужен
+    delete_at = profile.delete_at
+    days = (delete_at - datetime.utcnow()).days if delete_at else False
+    # Дни до удаления меняются каждый день, поэтому идут некэшируемым хвостом карточки
+    await answer_card(message, render_card(profile, VIEW_OWN, (
+        f"\n⏳ Дней до удаления: {days}\n"
+        f"🗓 Дата удаления: {delete_at.strftime('%d.%m.%Y %H:%M') if delete_at else 'неизвестно'}"
+    )))
 
 @router.callback_query(F.data == 'edit_profile')
 async def edit_profile_state(callback: CallbackQuery, state: FSMContext):
@@ -629,7 +531,7 @@ async def process_edit_video(message: Message, state: FSMContext, bot: Bot):
             f"📝 Описание: {new_description}\n"
             f"📝 Категория: {new_category}\n"
         )
-        await bot.send_video(chat_id='1653541807', video=profile.video_id, caption=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message, video_id=profile.video_id, edited=True)
         await message.answer('✅ Анкета отправлена на модерацию', reply_markup=get_main_keyboard(is_admin=is_admin))
     else:
         await message.answer(
@@ -672,7 +574,7 @@ async def process_edit_photo(message: Message, state: FSMContext, bot: Bot):
             f"📝 Описание: {new_description}\n"
             f"📝 Категория: {new_category}\n"
         )
-        await bot.send_photo(chat_id='1653541807', photo=profile.photo_id, caption=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message, photo_id=profile.photo_id, edited=True)
         await message.answer('✅ Анкета отправлена на модерацию', reply_markup=get_main_keyboard(is_admin=is_admin))
     else:
         await message.answer(
@@ -695,12 +597,12 @@ async def process_skip_media(message: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    user = await get_user(message.from_user.id)
-    if not user:
-        user = await create_user(message.from_user.id, message.from_user.username)
+    user_id = await get_user_id(message.from_user.id)
+    if user_id is None:
+        user_id = (await create_user(message.from_user.id, message.from_user.username)).id
     
     profile = await create_profile(
-        user_id=user.id,
+        user_id=user_id,
         description=data['description'],
         category=data['category'],
         video_id=None,
@@ -729,7 +631,7 @@ async def process_skip_media(message: Message, state: FSMContext, bot: Bot):
             f"✨ Категория: {profile.category}\n"
             f"📅 Создана: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
         )
-        await bot.send_message(chat_id='1653541807', text=admin_message, reply_markup=get_profile_verification_keyboard(profile.id))
+        await admin_notifier.profile_pending(bot, profile.id, admin_message)
     else:
         await message.answer(
             "⚠️ Произошла ошибка при создании анкеты. Пожалуйста, попробуйте позже",
@@ -761,14 +663,26 @@ async def show_pending_profiles(message: Message, state: FSMContext):
     if message.from_user.id != 1653541807:
         await message.answer("⚠️ У вас нет прав для доступа к этому разделу.")
         return
-    profiles = await get_need_profiles()
-    if not profiles:
+    await start_moderation(message, state)
+
+@router.callback_query(F.data == 'start_review')
+async def start_review_handler(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id != 1653541807:
+        await callback.answer("⚠️ У вас нет прав для выполнения этого действия", show_alert=True)
+        return
+    await callback.answer()
+    await start_moderation(callback.message, state)
+
+async def start_moderation(message: Message, state: FSMContext):
+    """Показывает первую анкету из очереди модерации"""
+    profile = await get_next_pending_profile()
+    if profile is None:
         await message.answer("⚠️ Нет анкет, ожидающих модерации.")
         return
 
     await state.set_state(ModerationStates.view_profiles)
-    await state.update_data(profiles=[p.id for p in profiles], current_index=0)
-    await show_profile_for_moderation(message, profiles[0].id)
+    await state.update_data(moderation_cursor=moderation_cursor(profile))
+    await show_profile_for_moderation(message, profile)
 
 @router.message(F.text == '🔙 Назад')
 async def back_button(message: Message):
@@ -788,7 +702,7 @@ async def verify_profile_handler(callback: CallbackQuery, bot: Bot, state: FSMCo
     profile_id = int(callback.data.split('_')[1])
     result = await verify_profile(profile_id)
     if result:
-        await bot.send_message(chat_id=result['telegram_id'], text="✅ Ваша анкета была одобрена модератором!\nТеперь она доступна для оценки другими пользователями.")
+        await outbound.send(bot, SendMessage(chat_id=result['telegram_id'], text="✅ Ваша анкета была одобрена модератором!\nТеперь она доступна для оценки другими пользователями."), PRIORITY_VERDICT, wait=False)
         await callback.answer('✅ Анкета одобрена')
         await next_profile(callback, state)
 
@@ -800,19 +714,19 @@ async def reject_profile_handler(callback: CallbackQuery, bot: Bot, state: FSMCo
     profile_id = int(callback.data.split('_')[1])
     # Получаем профиль до удаления, чтобы узнать telegram_id
     profile = await get_profile_for_moderation(profile_id)
-    if not profile or not profile.user:
+    if not profile:
         await callback.answer("⚠️ Анкета не найдена", show_alert=True)
         return
-    telegram_id = profile.user.telegram_id
+    telegram_id = profile.telegram_id
     result = await reject_profile(profile_id)
     if result:
-        await bot.send_message(
+        await outbound.send(bot, SendMessage(
             chat_id=telegram_id,
             text="❌ Ваша анкета была отклонена модератором.\nПожалуйста, создайте новую анкету с учетом правил:\n"
                  "1. Описание должно быть информативным\n"
                  "2. Видео должно быть качественным\n"
                  "3. Содержимое должно соответствовать правилам сообщества"
-        )
+        ), PRIORITY_VERDICT, wait=False)
         await callback.message.answer('Анкета отклонена')
         await next_profile(callback, state)
 
@@ -836,8 +750,9 @@ async def start_rating_profiles(message: Message, state: FSMContext):
         )
         return
     # Получаем доступные категории
-    categories = await get_available_categories()
-    if not categories or len(categories) <= 1:  # Только "Все" или пустой список
+    counts = await get_category_counts()
+    categories = ["Все"] + sorted(counts)
+    if not counts:  # Только "Все" или пустой список
         await message.answer(
             "😔 К сожалению, сейчас нет доступных анкет для оценки.\nПопробуйте позже!",
             reply_markup=get_main_keyboard(is_admin=is_admin)
@@ -848,7 +763,7 @@ async def start_rating_profiles(message: Message, state: FSMContext):
     await state.set_state(RatingStates.waiting_for_category_selection)
     await state.update_data(available_categories=categories)
     
-    categories_text = "\n".join([f"• {cat}" for cat in categories])
+    categories_text = format_categories(counts)
     await message.answer(
         f"📋 Выберите категорию анкет для оценивания:\n\n{categories_text}\n\n"
         "Нажмите на кнопку с нужной категорией:",
@@ -856,14 +771,14 @@ async def start_rating_profiles(message: Message, state: FSMContext):
     )
 
 @router.callback_query(F.data.startswith('select_category_'))
-async def process_category_selection(callback: CallbackQuery, state: FSMContext):
+async def process_category_selection(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Обработка выбора категории для оценивания"""
     category = callback.data.replace('select_category_', '')
     await state.update_data(selected_category=category)
     await state.set_state(ProfileViewStates.view_profiles)
     
     # Получаем анкету выбранной категории
-    profile = await get_random_profile_by_category(callback.from_user.id, category)
+    profile = await candidate_deck.next_profile(callback.from_user.id, category)
     
     if not profile:
         await callback.message.edit_text(
@@ -873,55 +788,16 @@ async def process_category_selection(callback: CallbackQuery, state: FSMContext)
         )
         return
     
-    if not profile.user:
-        await callback.message.edit_text(
-            "⚠️ Ошибка: не удалось загрузить данные пользователя.",
-            reply_markup=get_category_selection_keyboard(await get_available_categories())
-        )
-        return
-    
     await state.update_data(current_profile_id=profile.id)
-    
-    # Безопасно обрабатываем рейтинги
-    ratings = profile.received_ratings
-    if not ratings:
-        ratings = []
-    elif not isinstance(ratings, list):
-        ratings = [ratings]
-    avg_rating = round(sum(r.score for r in ratings) / len(ratings), 1) if ratings else 0
-    
-    profile_text = build_profile_text_for_caption([
-        f"📝 Описание: {profile.description}\n",
-        f"✨ Категория: {profile.category}\n",
-        f"⭐️ Средняя оценка: {avg_rating}\n",
-        f"📊 Количество оценок: {len(ratings)}"
-    ], for_caption=True)
-    
-    if profile.video_id:
-        await callback.message.edit_text("📹 Загружаю анкету...")
-        await callback.message.answer_video(
-            video=profile.video_id, 
-            caption=profile_text, 
-            reply_markup=get_rating_keyboard()
-        )
-    elif profile.photo_id:
-        await callback.message.edit_text("📷 Загружаю анкету...")
-        await callback.message.answer_photo(
-            photo=profile.photo_id, 
-            caption=profile_text, 
-            reply_markup=get_rating_keyboard()
-        )
-    else:
-        await callback.message.edit_text(
-            profile_text, 
-            reply_markup=get_rating_keyboard()
-        )
+    # Текстовая анкета заменяет меню категорий, анкета с медиа приходит новым сообщением
+    await replace_card(bot, callback.message, render_card(profile, VIEW_RATING))
 
 @router.callback_query(F.data == 'change_category')
 async def process_change_category(callback: CallbackQuery, state: FSMContext):
     """Обработка смены категории"""
-    categories = await get_available_categories()
-    categories_text = "\n".join([f"• {cat}" for cat in categories])
+    counts = await get_category_counts()
+    categories = ["Все"] + sorted(counts)
+    categories_text = format_categories(counts)
     
     await callback.message.edit_text(
         f"📋 Выберите новую категорию анкет для оценивания:\n\n{categories_text}\n\n"
@@ -931,107 +807,64 @@ async def process_change_category(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data.startswith('score_'))
 async def process_rating_score(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    print(f"DEBUG: process_rating_score вызвана для пользователя {callback.from_user.id}")
+    logger.debug(f"process_rating_score вызвана для пользователя {callback.from_user.id}")
     
     if not await state.get_state() == ProfileViewStates.view_profiles:
         await callback.answer("⚠️ Ошибка: неверное состояние", show_alert=True)
         return
-    score = int(callback.data.split('_')[1])
-    data = await state.get_data()
-    profile_id = data.get('current_profile_id')
-    if not profile_id:
-        await callback.answer("⚠️ Ошибка: анкета не найдена", show_alert=True)
+    # score_<id анкеты>_<оценка>: оценка относится к анкете на карточке, а не к текущей в состоянии —
+    # карточка меняется на месте, и повторное нажатие не должно оценить уже следующую анкету
+    parts = callback.data.split('_')
+    if len(parts) != 3:
+        await callback.answer("⚠️ Карточка устарела, откройте анкеты заново", show_alert=True)
         return
-    user = await get_user(callback.from_user.id)
-    if not user:
+    profile_id, score = int(parts[1]), int(parts[2])
+    data = await state.get_data()
+    user_id = await get_user_id(callback.from_user.id)
+    if user_id is None:
         await callback.answer("⚠️ Ошибка: пользователь не найден", show_alert=True)
         return
     
-    print(f"DEBUG: Создаём оценку score={score} для profile_id={profile_id}")
+    logger.debug(f"Создаём оценку score={score} для profile_id={profile_id}")
     
-    rating = await create_rating(user.id, profile_id, score, None)
-    if rating:
-        print(f"DEBUG: Оценка создана успешно, помечаем анкету просмотренной")
-        await mark_profile_as_viewed(callback.from_user.id, profile_id)
+    voted = await record_vote(user_id, profile_id, score)
+    # Оцененная анкета не должна снова попасться в колоде другой категории
+    candidate_deck.discard_for_user(callback.from_user.id, profile_id)
+    if voted:
+        logger.debug(f"Оценка и просмотр анкеты записаны")
         await callback.answer("✅ Спасибо за вашу оценку!")
-        
-        # Получаем информацию о следующей анкете перед удалением сообщения
-        user_telegram_id = callback.from_user.id
-        data = await state.get_data()
-        selected_category = data.get('selected_category', 'Все')
-        profile = await get_random_profile_by_category(user_telegram_id, selected_category)
-        
-        # await callback.message.delete()
-        print(f"DEBUG:f Вызываем show_next_profile")
-        
-        if not profile:
-            print(f"DEBUG: get_random_profile вернул None для пользователя {user_telegram_id}")
-            is_admin = user_telegram_id == 1653541807
-            categories = await get_available_categories()
-            await bot.send_message(
-                chat_id=user_telegram_id,
-                text=f"😔 К сожалению, в категории '{selected_category}' больше нет доступных анкет для оценки.\n"
-                     "Попробуйте выбрать другую категорию:",
-                reply_markup=get_category_selection_keyboard(categories)
-            )
-            await state.set_state(RatingStates.waiting_for_category_selection)
-            return
-        
-        if not profile.user:
-            print(f"DEBUG: profile.user равен None для profile_id {profile.id}")
-            is_admin = user_telegram_id == 1653541807
-            await bot.send_message(
-                chat_id=user_telegram_id,
-                text="⚠️ Ошибка: не удалось загрузить данные пользователя.",
-                reply_markup=get_main_keyboard(is_admin=is_admin)
-            )
-            await state.clear()
+    else:
+        await callback.answer("ℹ️ Вы уже оценили эту анкету")
+        if profile_id != data.get('current_profile_id'):
+            # Повтор колбэка со старой карточки: на ее месте уже показана следующая анкета
             return
+        # Текущая анкета уже оценена — показываем следующую, чтобы пользователь не застрял
 
-        # Показываем следующую анкету
-        await state.set_state(ProfileViewStates.view_profiles)
-        await state.update_data(current_profile_id=profile.id)
-        
-        # Безопасно обрабатываем рейтинги
-        ratings = profile.received_ratings
-        if not ratings:
-            ratings = []
-        elif not isinstance(ratings, list):
-            ratings = [ratings]
-        avg_rating = round(sum(r.score for r in ratings) / len(ratings), 2) if ratings else 0
-        
-        profile_text = build_profile_text_for_caption([
-            # f"👤 Анкета пользователя {get_display_username(profile.user.username)}\n\n",
-            f"📝 Описание: {profile.description}\n",
-            f"✨ Категория: {profile.category}\n",
-            f"⭐️ Средняя оценка: {avg_rating}\n",
-            f"📊 Количество оценок: {len(ratings)}"
-        ], for_caption=True)
-        
-        is_admin = user_telegram_id == 1653541807
-        
-        if profile.video_id:
-            await bot.send_video(
-                chat_id=user_telegram_id,
-                video=profile.video_id,
-                caption=profile_text,
-                reply_markup=get_rating_keyboard()
-            )
-        elif profile.photo_id:
-            await bot.send_photo(
-                chat_id=user_telegram_id,
-                photo=profile.photo_id,
-                caption=profile_text,
-                reply_markup=get_rating_keyboard()
-            )
-        else:
-            await bot.send_message(
-                chat_id=user_telegram_id,
-                text=profile_text,
-                reply_markup=get_rating_keyboard()
-            )
-    else:
-        await callback.answer("⚠️ Ошибка при сохранении оценки", show_alert=True)
+    # Получаем информацию о следующей анкете перед удалением сообщения
+    user_telegram_id = callback.from_user.id
+    selected_category = data.get('selected_category', 'Все')
+    profile = await candidate_deck.next_profile(user_telegram_id, selected_category)
+    
+    # await callback.message.delete()
+    logger.debug(f"Вызываем show_next_profile")
+    
+    if not profile:
+        logger.debug(f"get_random_profile вернул None для пользователя {user_telegram_id}")
+        categories = await get_available_categories()
+        await outbound.send(bot, SendMessage(
+            chat_id=user_telegram_id,
+            text=f"😔 К сожалению, в категории '{selected_category}' больше нет доступных анкет для оценки.\n"
+                 "Попробуйте выбрать другую категорию:",
+            reply_markup=get_category_selection_keyboard(categories)
+        ))
+        await state.set_state(RatingStates.waiting_for_category_selection)
+        return
+
+    # Показываем следующую анкету
+    await state.set_state(ProfileViewStates.view_profiles)
+    await state.update_data(current_profile_id=profile.id)
+    # Следующая анкета встает на место оцененной, а не добавляется в чат новым сообщением
+    await replace_card(bot, callback.message, render_card(profile, VIEW_RATING))
 
 @router.message(F.text == '🎉 Кто победитель?')
 async def show_winner(message: Message):
@@ -1039,39 +872,10 @@ async def show_winner(message: Message):
         await message.answer("⚠️ У вас нет прав для доступа к этому разделу")
         return
     winner = await get_winner_profile()
-    if not winner or not winner.user:
+    if not winner:
         await message.answer("⚠️ Нет анкет для определения победителя")
         return
-
-    ratings = winner.received_ratings
-    if not ratings:
-        ratings = []
-    elif not isinstance(ratings, list):
-        ratings = [ratings]
-    avg_rating = sum(r.score for r in ratings) / len(ratings) if ratings else 0
-
-    profile_text = build_profile_text_for_caption([
-        f"🏆 Победитель!\n\n",
-        f"👤 Пользователь: {get_display_username(winner.user.username)}\n",
-        f"⭐️ Средняя оценка: {round(avg_rating, 2)}\n",
-        f"📊 Количество оценок: {len(ratings)}\n",
-        f"✨ Категория: {winner.category}\n",
-        f"📝 Описание: {winner.description}"
-    ], for_caption=True)
-    if winner.video_id:
-        await message.answer_video(video=winner.video_id, caption=profile_text)
-    elif winner.photo_id:
-        await message.answer_photo(photo=winner.photo_id, caption=profile_text)
-    else:
-        # Для текстового сообщения применим более высокий лимит
-        await message.answer(text=build_profile_text_for_caption([
-            f"🏆 Победитель!\n\n",
-            f"👤 Пользователь: {get_display_username(winner.user.username)}\n",
-            f"⭐️ Средняя оценка: {round(avg_rating, 2)}\n",
-            f"📊 Количество оценок: {len(ratings)}\n",
-            f"✨ Категория: {winner.category}\n",
-            f"📝 Описание: {winner.description}"
-        ], for_caption=False))
+    await answer_card(message, render_card(winner, VIEW_WINNER))
 
 
 
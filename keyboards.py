@@ -42,15 +42,15 @@ def get_moderation_profile(profile_id: int):
     )
     return keyboard
 
-def get_rating_keyboard():
+def get_rating_keyboard(profile_id: int):
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
-                InlineKeyboardButton(text='1⭐', callback_data='score_1'),
-                InlineKeyboardButton(text='2⭐', callback_data='score_2'),
-                InlineKeyboardButton(text='3⭐', callback_data='score_3'),
-                InlineKeyboardButton(text='4⭐', callback_data='score_4'),
-                InlineKeyboardButton(text='5⭐', callback_data='score_5'),
+                InlineKeyboardButton(text='1⭐', callback_data=f'score_{profile_id}_1'),
+                InlineKeyboardButton(text='2⭐', callback_data=f'score_{profile_id}_2'),
+                InlineKeyboardButton(text='3⭐', callback_data=f'score_{profile_id}_3'),
+                InlineKeyboardButton(text='4⭐', callback_data=f'score_{profile_id}_4'),
+                InlineKeyboardButton(text='5⭐', callback_data=f'score_{profile_id}_5'),
             ]
         ]
     )
@@ -98,3 +98,13 @@ def get_category_selection_keyboard(categories: list):
     ])
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_review_start_keyboard():
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text='▶️ Начать проверку', callback_data='start_review')
+            ]
+        ]
+    )
+    return keyboard
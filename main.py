@@ -1,12 +1,32 @@
+from dotenv import load_dotenv
+
+# Настройки модулей читаются из окружения при импорте, поэтому .env загружаем до них
+load_dotenv()
+
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from handlers import router
-from database import init_db, periodic_delete
+from database import init_db, periodic_delete, start_vote_writer, stop_vote_writer
+from metrics import start_metrics_server
+from storage import SQLiteStorage
+from webhook import run_webhook
+from sender import outbound
+from notifications import admin_notifier
 import asyncio
 import logging
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+def create_dispatcher(storage: BaseStorage | None = None) -> Dispatcher:
+    """Диспетчер с обработчиками бота (используется и нагрузочным тестом benchmarks/loadtest.py)"""
+    if storage is None:
+        # Состояния FSM храним в SQLite, чтобы они переживали перезапуск (FSM_STORAGE=memory — в памяти)
+        storage = MemoryStorage() if os.getenv('FSM_STORAGE', 'sqlite') == 'memory' else SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    dp.include_router(router)
+    return dp
 
 async def main():
     logging.basicConfig(level=logging.INFO)
@@ -15,12 +35,32 @@ async def main():
     bot_token = os.getenv('BOT_TOKEN')
     if not bot_token:
         raise ValueError("BOT_TOKEN не найден в переменных окружения! Установите его в .env файле или через export BOT_TOKEN=your_token")
-    bot = Bot(token=bot_token)
+    # BOT_API_URL — свой сервер Bot API (например, fake_bot_api.py для тестов)
+    bot_api_url = os.getenv('BOT_API_URL')
+    session = AiohttpSession(api=TelegramAPIServer.from_base(bot_api_url)) if bot_api_url else None
+    bot = Bot(token=bot_token, session=session)
     
-    dp = Dispatcher()
-    dp.include_router(router)
+    dp = create_dispatcher()
     asyncio.create_task(periodic_delete())
-    await dp.start_polling(bot)
+    # Страница метрик Prometheus на локальном порту (если задан METRICS_PORT)
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        await start_metrics_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+    start_vote_writer()
+    try:
+        # BOT_MODE=webhook — принимать обновления через HTTP-сервер (настройки WEBHOOK_* в webhook.py)
+        if os.getenv('BOT_MODE', 'polling') == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        # Сначала дописываем голоса из буфера отложенной записи, затем досылаем сводку для администратора
+        # и поставленные в очередь сообщения. Шаги независимы: сбой одного не должен пропустить остальные
+        for step in (stop_vote_writer, lambda: admin_notifier.flush(bot), outbound.drain):
+            try:
+                await step()
+            except Exception as e:
+                logging.error(f"Ошибка при остановке бота: {e}")
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,180 @@
+from aiogram import BaseMiddleware
+from aiohttp import web
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Функция database.py, из которой сейчас выполняются запросы
+current_db_function: ContextVar[str] = ContextVar('current_db_function', default='other')
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: отдельная на каждое значение метки"""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            # [счетчики по корзинам..., +Inf], сумма
+            series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+db_query_seconds = Histogram(
+    'bot_db_query_seconds', 'Latency of single SQL statements by calling database.py function', 'function'
+)
+db_function_seconds = Histogram(
+    'bot_db_function_seconds', 'Latency of database.py functions', 'function'
+)
+handler_seconds = Histogram(
+    'bot_handler_seconds', 'Latency of aiogram handlers', 'handler'
+)
+_histograms = [db_query_seconds, db_function_seconds, handler_seconds]
+
+# Метрики, значения которых снимаются в момент запроса страницы: имя -> (описание, тип, функция)
+_collectors = {}
+
+
+def register_collector(name: str, help_text: str, collect, metric_type: str = 'gauge'):
+    """Регистрирует метрику, которая вычисляется при каждом запросе /metrics.
+
+    collect() возвращает число или словарь {строка меток: число}, например {'cache="user_id"': 10}.
+    """
+    _collectors[name] = (help_text, metric_type, collect)
+
+
+# Кэши процесса (объекты cache.TTLCache) по имени: их размер и счетчики попаданий попадают в метрики
+_caches = {}
+
+
+def register_cache(name: str, cache):
+    """Добавляет кэш в метрики bot_cache_events_total и bot_cache_size с меткой cache=name"""
+    _caches[name] = cache
+
+
+def _cache_events():
+    return {
+        f'cache="{name}",event="{event_name}"': value
+        for name, cache in _caches.items()
+        for event_name, value in cache.stats().items() if event_name != 'size'
+    }
+
+
+register_collector('bot_cache_events_total', 'Hits, misses and evictions of in-process caches', _cache_events, 'counter')
+register_collector(
+    'bot_cache_size', 'Entries in in-process caches', lambda: {f'cache="{name}"': len(cache) for name, cache in _caches.items()}
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in _histograms:
+        lines.extend(histogram.render())
+    for name, (help_text, metric_type, collect) in _collectors.items():
+        try:
+            value = collect()
+        except Exception as e:
+            logger.error(f"Ошибка при сборе метрики {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if isinstance(value, dict):
+            lines.extend(f"{name}{{{labels}}} {item}" for labels, item in value.items())
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def timed(func):
+    """Декоратор для функций database.py: помечает их запросы и замеряет время выполнения"""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_db_function.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            db_function_seconds.observe(name, time.perf_counter() - started)
+            current_db_function.reset(token)
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    db_query_seconds.observe(current_db_function.get(), time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def instrument_engine(sync_engine):
+    """Подключает замер времени каждого SQL-запроса к движку SQLAlchemy"""
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Middleware роутера: замеряет время работы каждого обработчика"""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object is not None else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_seconds.observe(name, time.perf_counter() - started)
+
+
+async def _metrics_view(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host: str = '127.0.0.1', port: int = 9100):
+    """Запускает HTTP-сервер со страницей /metrics в формате Prometheus"""
+    app = web.Application()
+    app.router.add_get('/metrics', _metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
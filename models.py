@@ -1,6 +1,8 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, case
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
 from datetime import datetime, timedelta
+import random
 
 class Base(DeclarativeBase):
     pass
@@ -17,6 +19,15 @@ class User(Base):
 
 class Profile(Base):
     __tablename__ = 'profiles'
+    __table_args__ = (
+        # Случайная выборка анкеты: поиск по индексу от случайной точки random_key.
+        # Первый индекс заодно обслуживает фильтры по (is_verified, category)
+        Index('ix_profiles_verified_category_random_key', 'is_verified', 'category', 'random_key'),
+        Index('ix_profiles_verified_random_key', 'is_verified', 'random_key'),
+        # Очередь модерации и поиск анкеты пользователя (самая новая первой)
+        Index('ix_profiles_verified_created_at', 'is_verified', 'created_at'),
+        Index('ix_profiles_user_created_at', 'user_id', 'created_at'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
     description: Mapped[str]
@@ -25,16 +36,36 @@ class Profile(Base):
     video_id: Mapped[str] = mapped_column(nullable=True)
     is_verified: Mapped[bool] = mapped_column(default=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
-    delete_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now()+timedelta(days=7))
+    delete_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now()+timedelta(days=7), index=True)
+    # Денормализованные агрегаты оценок, обновляются в одной транзакции с каждой оценкой
+    rating_count: Mapped[int] = mapped_column(default=0, server_default='0')
+    rating_sum: Mapped[float] = mapped_column(default=0, server_default='0')
+    random_key: Mapped[float] = mapped_column(default=random.random, server_default='0')
+    # Растет при каждом изменении, видимом в карточке (правка, одобрение, новая оценка): ключ кэша отрисовки
+    version: Mapped[int] = mapped_column(default=0, server_default='0')
     user: Mapped['User'] = relationship(back_populates='profiles')
     received_ratings: Mapped[list['Rating']] = relationship(back_populates='profile')
     viewed_by: Mapped[list['ProfileView']] = relationship(back_populates='profile')
 
+    @hybrid_property
+    def avg_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @avg_rating.inplace.expression
+    @classmethod
+    def _avg_rating_expression(cls):
+        return case((cls.rating_count > 0, cls.rating_sum / cls.rating_count), else_=0.0)
+
 class Rating(Base):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        # Одна оценка на пару (пользователь, анкета): повторный колбэк кнопки оценки гасится ON CONFLICT.
+        # Индекс заодно обслуживает поиск оценок пользователя (rater_id — первая колонка)
+        Index('uq_ratings_rater_profile', 'rater_id', 'profile_id', unique=True),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     rater_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-    profile_id: Mapped[int] = mapped_column(ForeignKey('profiles.id'))
+    profile_id: Mapped[int] = mapped_column(ForeignKey('profiles.id'), index=True)
     score: Mapped[float]
     comment: Mapped[str] = mapped_column(nullable=True)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
@@ -43,9 +74,13 @@ class Rating(Base):
 
 class ProfileView(Base):
     __tablename__ = 'profile_views'
+    __table_args__ = (
+        # Один просмотр на пару (пользователь, анкета); по этому индексу идет анти-джойн просмотренных
+        Index('uq_profile_views_viewer_profile', 'viewer_id', 'profile_id', unique=True),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     viewer_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-    profile_id: Mapped[int] = mapped_column(ForeignKey('profiles.id'))
+    profile_id: Mapped[int] = mapped_column(ForeignKey('profiles.id'), index=True)
     viewed_at: Mapped[datetime] = mapped_column(default=datetime.now)
     viewer: Mapped['User'] = relationship(back_populates='profile_views')
     profile: Mapped['Profile'] = relationship(back_populates='viewed_by')
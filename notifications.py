@@ -0,0 +1,77 @@
+from aiogram import Bot
+from aiogram.methods import SendMessage, SendPhoto, SendVideo
+from database import get_pending_profiles_count
+from keyboards import get_profile_verification_keyboard, get_review_start_keyboard
+from sender import outbound, PRIORITY_ADMIN
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ADMIN_CHAT_ID = int(os.getenv('ADMIN_CHAT_ID', '1653541807'))
+# immediate — каждая анкета отдельным сообщением с медиа; digest — одна сводка за окно ADMIN_DIGEST_WINDOW секунд
+ADMIN_NOTIFY_MODE = os.getenv('ADMIN_NOTIFY_MODE', 'immediate')
+ADMIN_DIGEST_WINDOW = float(os.getenv('ADMIN_DIGEST_WINDOW', '60'))
+
+
+class AdminNotifier:
+    """Уведомления администратору об анкетах, ожидающих модерации.
+
+    В режиме digest события копятся в течение окна, после чего уходит одно сообщение
+    с количеством новых и измененных анкет и кнопкой перехода к проверке.
+    """
+
+    def __init__(self, mode: str = ADMIN_NOTIFY_MODE, window: float = ADMIN_DIGEST_WINDOW,
+                 chat_id: int = ADMIN_CHAT_ID):
+        self.mode = mode
+        self.window = window
+        self.chat_id = chat_id
+        self._created = set()
+        self._edited = set()
+        self._digest_task = None
+
+    async def profile_pending(self, bot: Bot, profile_id: int, text: str, video_id: str | None = None,
+                              photo_id: str | None = None, edited: bool = False):
+        """Сообщает о новой или измененной анкете, ожидающей модерации"""
+        if self.mode != 'digest':
+            keyboard = get_profile_verification_keyboard(profile_id)
+            if video_id:
+                method = SendVideo(chat_id=self.chat_id, video=video_id, caption=text, reply_markup=keyboard)
+            elif photo_id:
+                method = SendPhoto(chat_id=self.chat_id, photo=photo_id, caption=text, reply_markup=keyboard)
+            else:
+                method = SendMessage(chat_id=self.chat_id, text=text, reply_markup=keyboard)
+            await outbound.send(bot, method, PRIORITY_ADMIN, wait=False)
+            return
+        (self._edited if edited else self._created).add(profile_id)
+        if self._digest_task is None or self._digest_task.done():
+            self._digest_task = asyncio.create_task(self._send_digest_later(bot))
+
+    async def flush(self, bot: Bot):
+        """Отправляет сводку по накопленным событиям, если они есть"""
+        created, edited = self._created, self._edited - self._created
+        self._created, self._edited = set(), set()
+        if not created and not edited:
+            return
+        pending = await get_pending_profiles_count()
+        lines = ["📋 Анкеты на модерацию\n"]
+        if created:
+            lines.append(f"🆕 Новых: {len(created)}")
+        if edited:
+            lines.append(f"✏️ Измененных: {len(edited)}")
+        lines.append(f"\n⏳ Всего ожидают проверки: {pending}")
+        await outbound.send(
+            bot, SendMessage(chat_id=self.chat_id, text="\n".join(lines), reply_markup=get_review_start_keyboard()),
+            PRIORITY_ADMIN, wait=False
+        )
+
+    async def _send_digest_later(self, bot: Bot):
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush(bot)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сводки модерации: {e}")
+
+
+admin_notifier = AdminNotifier()
@@ -0,0 +1,199 @@
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import (
+    SendMessage, SendPhoto, SendVideo, EditMessageText, EditMessageCaption, EditMessageMedia
+)
+from aiogram.types import Message, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo
+from dataclasses import dataclass
+from cache import TTLCache
+from keyboards import get_rating_keyboard, get_profile_edit, get_moderation_profile
+from metrics import register_cache
+from sender import outbound, PRIORITY_CARD
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничения: caption до ~1024 символов, текст до ~4096
+CAPTION_LIMIT = 1000
+TEXT_LIMIT = 4000
+
+# Виды карточки анкеты
+VIEW_RATING = 'rating'          # анкета для оценивания
+VIEW_OWN = 'own'                # своя анкета пользователя
+VIEW_MODERATION = 'moderation'  # анкета в очереди модерации
+VIEW_WINNER = 'winner'          # победитель
+
+# Сколько отрисованных карточек держать в памяти
+CARD_CACHE_SIZE = int(os.getenv('CARD_CACHE_SIZE', '10000'))
+
+
+def get_display_username(username: str | None) -> str:
+    """Безопасно получает username для отображения"""
+    if username:
+        return f"@{username}"
+    return "Пользователь без username"
+
+
+def truncate_text(text: str, max_length: int) -> str:
+    if not text:
+        return ""
+    if len(text) <= max_length:
+        return text
+    return text[: max_length - 3] + "..."
+
+
+def build_profile_text_for_caption(lines: list[str], for_caption: bool = True) -> str:
+    # Склеиваем строки и обрезаем под лимит
+    text = "".join(lines)
+    limit = CAPTION_LIMIT if for_caption else TEXT_LIMIT
+    return truncate_text(text, limit)
+
+
+@dataclass(frozen=True, slots=True)
+class RenderedCard:
+    """Готовая к отправке карточка: тип медиа, file_id, подпись или текст и клавиатура"""
+    media_type: str  # 'video', 'photo' или 'text'
+    media_id: str | None
+    text: str
+    keyboard: InlineKeyboardMarkup | None
+
+    @property
+    def limit(self) -> int:
+        return TEXT_LIMIT if self.media_type == 'text' else CAPTION_LIMIT
+
+
+# (id анкеты, created_at, версия анкеты, вид) -> RenderedCard; версия растет при каждом видимом
+# изменении анкеты, поэтому устаревшие записи просто перестают запрашиваться и вытесняются.
+# id и версия не уникальны между анкетами: SQLite отдает id удаленной последней анкеты новой,
+# а версия у новой анкеты снова 0, — различает их время создания
+card_cache = TTLCache(maxsize=CARD_CACHE_SIZE)
+register_cache('profile_card', card_cache)
+
+
+def _card_lines(profile, view: str) -> list[str]:
+    if view == VIEW_RATING:
+        return [
+            f"📝 Описание: {profile.description}\n",
+            f"✨ Категория: {profile.category}\n",
+            f"⭐️ Средняя оценка: {round(profile.avg_rating, 2)}\n",
+            f"📊 Количество оценок: {profile.rating_count}",
+        ]
+    if view == VIEW_OWN:
+        return [
+            f"👤 Ваша анкета: {get_display_username(profile.username)}\n",
+            f"📝 Описание: {profile.description}\n",
+            f"✨ Категория: {profile.category}\n",
+            f"⭐️ Средняя оценка: {round(profile.avg_rating, 1)}\n",
+            f"📈 Количество оценок: {profile.rating_count}",
+        ]
+    if view == VIEW_MODERATION:
+        created_at = profile.created_at.strftime('%d.%m.%Y %H:%M') if profile.created_at else 'неизвестно'
+        return [
+            "📝 Анкета на модерацию:\n\n",
+            f"👤 Пользователь: {get_display_username(profile.username)}\n",
+            f"📝 Описание: {profile.description}\n",
+            f"✨ Категория: {profile.category}\n",
+            f"📅 Создана: {created_at}",
+        ]
+    if view == VIEW_WINNER:
+        return [
+            "🏆 Победитель!\n\n",
+            f"👤 Пользователь: {get_display_username(profile.username)}\n",
+            f"⭐️ Средняя оценка: {round(profile.avg_rating, 2)}\n",
+            f"📊 Количество оценок: {profile.rating_count}\n",
+            f"✨ Категория: {profile.category}\n",
+            f"📝 Описание: {profile.description}",
+        ]
+    raise ValueError(f"Неизвестный вид карточки: {view}")
+
+
+def _card_keyboard(profile, view: str) -> InlineKeyboardMarkup | None:
+    if view == VIEW_RATING:
+        return get_rating_keyboard(profile.id)
+    if view == VIEW_OWN:
+        return get_profile_edit()
+    if view == VIEW_MODERATION:
+        return get_moderation_profile(profile.id)
+    return None
+
+
+def render_card(profile, view: str, footer: str = '') -> RenderedCard:
+    """Карточка анкеты в нужном виде; footer — изменчивый хвост текста, который не кэшируется
+    (дни до удаления, остаток очереди модерации)"""
+    key = (profile.id, profile.created_at, profile.version, view)
+    card = card_cache.get(key)
+    if card is None:
+        if profile.video_id and profile.video_id.strip():
+            media_type, media_id = 'video', profile.video_id
+        elif profile.photo_id and profile.photo_id.strip():
+            media_type, media_id = 'photo', profile.photo_id
+        else:
+            media_type, media_id = 'text', None
+        text = build_profile_text_for_caption(_card_lines(profile, view), for_caption=media_type != 'text')
+        card = RenderedCard(media_type, media_id, text, _card_keyboard(profile, view))
+        card_cache.set(key, card)
+    if footer:
+        text = truncate_text(card.text, card.limit - len(footer)) + footer
+        return RenderedCard(card.media_type, card.media_id, text, card.keyboard)
+    return card
+
+
+def card_method(card: RenderedCard, chat_id: int):
+    """Вызов Bot API, отправляющий карточку в чат (для очереди исходящих сообщений)"""
+    if card.media_type == 'video':
+        return SendVideo(chat_id=chat_id, video=card.media_id, caption=card.text, reply_markup=card.keyboard)
+    if card.media_type == 'photo':
+        return SendPhoto(chat_id=chat_id, photo=card.media_id, caption=card.text, reply_markup=card.keyboard)
+    return SendMessage(chat_id=chat_id, text=card.text, reply_markup=card.keyboard)
+
+
+def card_edit_method(card: RenderedCard, message: Message):
+    """Вызов Bot API, заменяющий содержимое уже отправленного сообщения карточкой, или None,
+    если сообщение этого типа нельзя отредактировать в карточку (текст в медиа и обратно)"""
+    if not isinstance(message, Message):
+        # Сообщение слишком старое, бот его уже не видит
+        return None
+    target = dict(chat_id=message.chat.id, message_id=message.message_id, reply_markup=card.keyboard)
+    if card.media_type == 'text':
+        if message.text is None:
+            return None
+        return EditMessageText(text=card.text, **target)
+    if message.video is not None:
+        current = message.video.file_id
+    elif message.photo:
+        current = message.photo[-1].file_id
+    else:
+        return None
+    if current == card.media_id:
+        # То же видео или фото — меняем только подпись
+        return EditMessageCaption(caption=card.text, **target)
+    if card.media_type == 'video':
+        media = InputMediaVideo(media=card.media_id, caption=card.text)
+    else:
+        media = InputMediaPhoto(media=card.media_id, caption=card.text)
+    return EditMessageMedia(media=media, **target)
+
+
+async def replace_card(bot: Bot, message: Message, card: RenderedCard, priority: int = PRIORITY_CARD):
+    """Показывает карточку на месте сообщения message; новым сообщением — только если его
+    нельзя отредактировать"""
+    method = card_edit_method(card, message)
+    if method is not None:
+        try:
+            return await outbound.send(bot, method, priority)
+        except TelegramBadRequest as e:
+            if 'message is not modified' in e.message:
+                return None
+            # Удаленное или слишком старое сообщение, другой тип медиа и т.п.
+            logger.debug(f"Не удалось отредактировать карточку в чате {message.chat.id}: {e.message}")
+    return await outbound.send(bot, card_method(card, message.chat.id), priority)
+
+
+async def answer_card(message: Message, card: RenderedCard):
+    """Отправляет карточку ответом в чат сообщения"""
+    if card.media_type == 'video':
+        return await message.answer_video(video=card.media_id, caption=card.text, reply_markup=card.keyboard)
+    if card.media_type == 'photo':
+        return await message.answer_photo(photo=card.media_id, caption=card.text, reply_markup=card.keyboard)
+    return await message.answer(card.text, reply_markup=card.keyboard)
@@ -0,0 +1,196 @@
+"""Генератор синтетических данных для схемы models.py: пользователи, анкеты, оценки и просмотры.
+
+Распределения приближены к боевым:
+- число оценок на анкету подчиняется закону Ципфа — немногие популярные анкеты собирают
+  большую часть голосов, у длинного хвоста голосов почти нет;
+- анкеты равномерно распределены по шести категориям бота;
+- часть анкет ждет модерации (без оценок и просмотров), часть уже просрочена (delete_at в прошлом);
+- каждый оценивший анкету ее просмотрел, плюс просмотры без оценки.
+
+Строки вставляются пачками через executemany драйвера (Connection.exec_driver_sql с кортежами),
+без ORM-объектов и без обработки параметров SQLAlchemy на каждую строку; вторичные индексы
+на время заливки снимаются и строятся заново в конце. Таблицы должны быть пустыми.
+
+Запуск: python seed.py --profiles 1000000 [--users 1200000] [--votes 3000000] [--reset]
+(использует ту же базу, что и бот: SQLITE_PATH / USE_POSTGRESQL и POSTGRES_*)
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from models import Base, Profile, Rating, ProfileView
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import random
+import time
+
+# Категории анкет, которые предлагает бот при создании анкеты
+CATEGORIES = ['Игры', 'Программирование', 'Кулинария', 'Искусство', 'Жизнь', 'Бизнес']
+TELEGRAM_ID_BASE = 1_000_000
+BATCH_SIZE = 50_000
+PROFILE_LIFETIME = timedelta(days=7)
+
+USER_COLUMNS = ('id', 'telegram_id', 'username', 'created_at')
+PROFILE_COLUMNS = (
+    'id', 'user_id', 'description', 'category', 'video_id', 'photo_id', 'is_verified', 'created_at',
+    'delete_at', 'rating_count', 'rating_sum', 'random_key', 'version',
+)
+RATING_COLUMNS = ('rater_id', 'profile_id', 'score', 'comment', 'created_at')
+VIEW_COLUMNS = ('viewer_id', 'profile_id', 'viewed_at')
+
+
+def zipf_counts(total: int, items: int, exponent: float, cap: int) -> list[int]:
+    """Раскладывает total голосов по items анкетам по закону Ципфа: у анкеты ранга r ~ 1/r^exponent.
+    Ни одной анкете не достается больше cap голосов (один голос от пользователя)"""
+    if items <= 0 or total <= 0:
+        return [0] * max(items, 0)
+    weights = [rank ** -exponent for rank in range(1, items + 1)]
+    scale = total / sum(weights)
+    counts = [min(cap, int(weight * scale)) for weight in weights]
+    # Остаток от округления вниз раздаем по одному голосу, начиная с популярных
+    remainder = total - sum(counts)
+    for rank in range(items):
+        if remainder <= 0:
+            break
+        if counts[rank] < cap:
+            counts[rank] += 1
+            remainder -= 1
+    return counts
+
+
+def _insert_sql(dialect, table: str, columns: tuple[str, ...]) -> str:
+    """INSERT с плейсхолдерами в стиле драйвера (aiosqlite — ?, asyncpg — $1)"""
+    if dialect.paramstyle == 'qmark':
+        marks = ['?'] * len(columns)
+    elif dialect.paramstyle == 'numeric_dollar':
+        marks = [f'${number}' for number in range(1, len(columns) + 1)]
+    elif dialect.paramstyle == 'numeric':
+        marks = [f':{number}' for number in range(1, len(columns) + 1)]
+    else:
+        marks = ['%s'] * len(columns)
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(marks)})"
+
+
+def _secondary_indexes():
+    return [index for table in (Profile.__table__, Rating.__table__, ProfileView.__table__) for index in table.indexes]
+
+
+async def _reset_sequences(conn):
+    """В PostgreSQL id вставлялись явно — сдвигаем последовательности, чтобы бот мог добавлять строки"""
+    for table in ('users', 'profiles', 'ratings', 'profile_views'):
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+
+
+async def seed_database(engine: AsyncEngine, profiles: int, users: int | None = None, votes: int | None = None,
+                        views_per_vote: float = 2.0, unverified: float = 0.1, expired: float = 0.02,
+                        zipf_exponent: float = 1.1, telegram_id_base: int = TELEGRAM_ID_BASE,
+                        batch_size: int = BATCH_SIZE, seed: int | None = None) -> dict:
+    """Заполняет пустые таблицы и возвращает, сколько строк вставлено в каждую.
+
+    Анкета i принадлежит пользователю i, пользователи сверх числа анкет только оценивают.
+    По умолчанию пользователей столько же, сколько анкет, а голосов — по три на анкету.
+    """
+    rng = random.Random(seed)
+    users = max(users or profiles, profiles, 2)
+    votes = 3 * profiles if votes is None else votes
+    now = datetime.now()
+    counts = {'users': users, 'profiles': profiles, 'ratings': 0, 'profile_views': 0}
+    dialect = engine.dialect
+    # В SQLite SQLAlchemy хранит даты строками "YYYY-MM-DD HH:MM:SS.ffffff" — такие и пишем; asyncpg берет datetime
+    stamp = str if dialect.name == 'sqlite' else (lambda value: value)
+    insert_user = _insert_sql(dialect, 'users', USER_COLUMNS)
+    insert_profile = _insert_sql(dialect, 'profiles', PROFILE_COLUMNS)
+    insert_rating = _insert_sql(dialect, 'ratings', RATING_COLUMNS)
+    insert_view = _insert_sql(dialect, 'profile_views', VIEW_COLUMNS)
+
+    # Голоса достаются только одобренным анкетам; популярность (ранг Ципфа) раздаем случайно
+    verified_ids = [i for i in range(1, profiles + 1) if rng.random() >= unverified]
+    rng.shuffle(verified_ids)
+    votes_by_profile = dict(zip(verified_ids, zipf_counts(votes, len(verified_ids), zipf_exponent, users - 1)))
+
+    # Вторичные индексы дешевле построить один раз в конце, чем обновлять на каждую строку.
+    # Если заливка прервется, недостающие индексы создаст init_db() при следующем запуске
+    indexes = _secondary_indexes()
+    async with engine.begin() as conn:
+        for index in indexes:
+            await conn.run_sync(index.drop)
+
+    user_created_at = stamp(now - timedelta(days=30))
+    async with engine.begin() as conn:
+        for start in range(1, users + 1, batch_size):
+            await conn.exec_driver_sql(insert_user, [
+                (i, telegram_id_base + i, f'user{i}', user_created_at)
+                for i in range(start, min(start + batch_size, users + 1))
+            ])
+
+    for start in range(1, profiles + 1, batch_size):
+        profile_rows, rating_rows, view_rows = [], [], []
+        for i in range(start, min(start + batch_size, profiles + 1)):
+            vote_count = votes_by_profile.get(i)
+            age = PROFILE_LIFETIME * rng.random()
+            if rng.random() < expired:
+                age += PROFILE_LIFETIME
+            created_at = now - age
+            rating_count, rating_sum = 0, 0.0
+            if vote_count:
+                view_count = min(users - 1, max(vote_count, round(vote_count * views_per_vote)))
+                viewers = [v for v in rng.sample(range(1, users + 1), view_count + 1) if v != i][:view_count]
+                # Оценки смещены к высоким, как у живых пользователей
+                scores = rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 5, 6), k=vote_count)
+                seen_at = [stamp(created_at + age * rng.random()) for _ in viewers]
+                view_rows += zip(viewers, [i] * view_count, seen_at)
+                rating_rows += zip(viewers[:vote_count], [i] * vote_count, scores, [None] * vote_count, seen_at)
+                rating_count, rating_sum = vote_count, float(sum(scores))
+            profile_rows.append((
+                i, i, f'Анкета пользователя {i}', CATEGORIES[rng.randrange(len(CATEGORIES))],
+                f'video-{i}' if i % 3 == 0 else None, f'photo-{i}' if i % 3 == 1 else None,
+                i in votes_by_profile, stamp(created_at), stamp(created_at + PROFILE_LIFETIME),
+                rating_count, rating_sum, rng.random(), 0,
+            ))
+        # Пачка анкет — одна транзакция вместе с ее оценками и просмотрами
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(insert_profile, profile_rows)
+            if rating_rows:
+                await conn.exec_driver_sql(insert_rating, rating_rows)
+            if view_rows:
+                await conn.exec_driver_sql(insert_view, view_rows)
+        counts['ratings'] += len(rating_rows)
+        counts['profile_views'] += len(view_rows)
+
+    async with engine.begin() as conn:
+        for index in indexes:
+            await conn.run_sync(index.create)
+        if dialect.name == 'postgresql':
+            await _reset_sequences(conn)
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=100_000)
+    parser.add_argument('--users', type=int, help='по умолчанию равно числу анкет')
+    parser.add_argument('--votes', type=int, help='всего оценок, по умолчанию 3 на анкету')
+    parser.add_argument('--views-per-vote', type=float, default=2.0, help='просмотров на одну оценку')
+    parser.add_argument('--unverified', type=float, default=0.1, help='доля анкет на модерации')
+    parser.add_argument('--expired', type=float, default=0.02, help='доля просроченных анкет')
+    parser.add_argument('--zipf', type=float, default=1.1, help='показатель закона Ципфа для голосов')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='удалить и создать таблицы заново перед заполнением')
+    args = parser.parse_args()
+
+    import database
+    if args.reset:
+        async with database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+    await database.init_db()
+    started = time.perf_counter()
+    counts = await seed_database(
+        database.engine, args.profiles, users=args.users, votes=args.votes, views_per_vote=args.views_per_vote,
+        unverified=args.unverified, expired=args.expired, zipf_exponent=args.zipf, seed=args.seed
+    )
+    print(f"Вставлено за {time.perf_counter() - started:.1f} с: {counts}")
+    await database.engine.dispose()
+
+if __name__ == '__main__':
+    asyncio.run(main())
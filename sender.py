@@ -0,0 +1,231 @@
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from cache import TTLCache
+from metrics import register_collector
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: меньше — важнее
+PRIORITY_CARD = 0       # карточки и ответы пользователю, которые он ждет прямо сейчас
+PRIORITY_VERDICT = 1    # решения модератора по анкете
+PRIORITY_ADMIN = 2      # уведомления администратору
+_PRIORITY_NAMES = {PRIORITY_CARD: 'card', PRIORITY_VERDICT: 'verdict', PRIORITY_ADMIN: 'admin'}
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и около одного в секунду в один чат
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '25'))
+SEND_GLOBAL_BURST = float(os.getenv('SEND_GLOBAL_BURST', '25'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = float(os.getenv('SEND_CHAT_BURST', '3'))
+# Сколько раз повторять отправку после ответа 429 (retry_after)
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '5'))
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity накопленных"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд появится токен (0 — уже есть)"""
+        if now < self.updated:
+            # Ведро заблокировано до self.updated
+            return self.updated - now + max(0.0, 1 - self.tokens) / self.rate
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """Запрещает отправку на seconds секунд (после retry_after от Telegram)"""
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class _Outgoing:
+    __slots__ = ('priority', 'seq', 'bot', 'method', 'chat_id', 'future', 'attempts')
+
+    def __init__(self, priority, seq, bot, method, future):
+        self.priority = priority
+        self.seq = seq
+        self.bot = bot
+        self.method = method
+        # chat_id бывает и числом, и строкой — приводим к одному виду для ведер чатов
+        self.chat_id = str(getattr(method, 'chat_id', None))
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundSender:
+    """Общая очередь исходящих сообщений бота с учетом лимитов Telegram.
+
+    Сообщения уходят в порядке приоритета, не чаще global_rate в секунду в сумме и chat_rate
+    в секунду в один чат; в один чат одновременно идет не больше одного запроса, поэтому
+    порядок сообщений в чате сохраняется. На 429 чат ставится на паузу retry_after, а
+    сообщение возвращается в очередь.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, global_burst: float = SEND_GLOBAL_BURST,
+                 chat_rate: float = SEND_CHAT_RATE, chat_burst: float = SEND_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        # Ведра чатов, из которых давно ничего не отправлялось, уже полные — их можно забыть
+        self._chat_buckets = TTLCache(maxsize=100000, ttl=600)
+        self._queue = []
+        self._busy_chats = set()
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._loop = None
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def send(self, bot: Bot, method: TelegramMethod, priority: int = PRIORITY_CARD, wait: bool = True):
+        """Ставит вызов Bot API в очередь. При wait=True дожидается отправки и возвращает ее результат,
+        иначе сразу возвращает управление, а ошибка отправки только логируется"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        bisect.insort(self._queue, _Outgoing(priority, next(self._seq), bot, method, future))
+        self._wakeup.set()
+        if not wait:
+            future.add_done_callback(self._log_failure)
+            return None
+        return await future
+
+    def depth(self) -> dict:
+        counts = dict.fromkeys(_PRIORITY_NAMES.values(), 0)
+        for item in self._queue:
+            counts[_PRIORITY_NAMES.get(item.priority, str(item.priority))] += 1
+        return counts
+
+    async def drain(self, timeout: float = 10.0):
+        """Ждет, пока очередь опустеет (при остановке бота)"""
+        deadline = time.monotonic() + timeout
+        while (self._queue or self._busy_chats) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._queue:
+            logger.warning(f"Не отправлено сообщений при остановке: {len(self._queue)}")
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch()
+            if delay == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self):
+        """Запускает отправку всего, что можно отправить сейчас. Возвращает, сколько ждать
+        до следующей возможности (None — пока в очереди ничего не появится)"""
+        now = time.monotonic()
+        next_delay = None
+        index = 0
+        while index < len(self._queue):
+            global_wait = self._global_bucket.wait_time(now)
+            if global_wait > 0:
+                return global_wait
+            item = self._queue[index]
+            if item.chat_id in self._busy_chats:
+                index += 1
+                continue
+            bucket = self._chat_bucket(item.chat_id)
+            chat_wait = bucket.wait_time(now)
+            if chat_wait > 0:
+                next_delay = chat_wait if next_delay is None else min(next_delay, chat_wait)
+                index += 1
+                continue
+            del self._queue[index]
+            if item.future.cancelled():
+                continue
+            self._global_bucket.consume()
+            bucket.consume()
+            self._busy_chats.add(item.chat_id)
+            self._loop.create_task(self._deliver(item))
+        return next_delay
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def _deliver(self, item: _Outgoing):
+        try:
+            result = await item.bot(item.method)
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            self.retries += 1
+            self._chat_bucket(item.chat_id).block(e.retry_after)
+            if item.attempts > self.max_retries:
+                self.failed += 1
+                self._finish(item, exception=e)
+            else:
+                logger.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в чат {item.chat_id}")
+                bisect.insort(self._queue, item)
+        except Exception as e:
+            self.failed += 1
+            self._finish(item, exception=e)
+        else:
+            self.sent += 1
+            self._finish(item, result=result)
+        finally:
+            self._busy_chats.discard(item.chat_id)
+            self._wakeup.set()
+
+    @staticmethod
+    def _finish(item: _Outgoing, result=None, exception=None):
+        if item.future.done():
+            return
+        if exception is not None:
+            item.future.set_exception(exception)
+        else:
+            item.future.set_result(result)
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка при отправке сообщения: {future.exception()}")
+
+
+outbound = OutboundSender()
+register_collector(
+    'bot_outbound_queue_depth', 'Outgoing Bot API calls waiting in the send queue',
+    lambda: {f'priority="{name}"': count for name, count in outbound.depth().items()}
+)
+register_collector(
+    'bot_outbound_messages_total', 'Outgoing Bot API calls by outcome',
+    lambda: {'outcome="sent"': outbound.sent, 'outcome="retried"': outbound.retries, 'outcome="failed"': outbound.failed},
+    'counter'
+)
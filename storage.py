@@ -0,0 +1,238 @@
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, DefaultKeyBuilder
+from sqlalchemy import MetaData, Table, Column, String, Text, Float, select, delete, or_, and_, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from metrics import register_collector
+import asyncio
+import logging
+import weakref
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Отдельная база для состояний FSM, чтобы их запись не мешала основной базе бота
+FSM_DATABASE_URL = os.getenv('FSM_DATABASE_URL', 'sqlite+aiosqlite:///fsm.db')
+# Через сколько секунд накопленные изменения состояний записываются одной транзакцией (0 — сразу).
+# В режиме вебхука за балансировщиком базу состояний делят несколько экземпляров бота, и отложенную
+# запись другой экземпляр не увидит, поэтому там по умолчанию пишем сразу
+FSM_WRITE_DELAY = float(os.getenv('FSM_WRITE_DELAY', '0' if os.getenv('BOT_MODE') == 'webhook' else '0.05'))
+# Сколько живет брошенный разговор и как часто удалять устаревшие записи, в секундах
+FSM_TTL = float(os.getenv('FSM_TTL', str(7 * 24 * 3600)))
+FSM_CLEANUP_INTERVAL = float(os.getenv('FSM_CLEANUP_INTERVAL', '3600'))
+
+metadata = MetaData()
+
+fsm_records = Table(
+    'fsm_records', metadata,
+    Column('key', String, primary_key=True),
+    Column('state', String, nullable=True),
+    # Данные в компактном JSON; пустой словарь хранится как NULL
+    Column('data', Text, nullable=True),
+    Column('updated_at', Float, nullable=False, index=True),
+)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _dump(data) -> str | None:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')) if data else None
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице SQLite: состояния переживают перезапуск.
+
+    Изменения копятся в памяти и записываются пачкой раз в write_delay секунд; пока запись
+    не дошла до базы, чтения отдают значения из памяти. Записи, не менявшиеся дольше ttl,
+    считаются пустыми и периодически удаляются.
+
+    Другие процессы видят изменение только после его записи: с write_delay > 0 это окно
+    до write_delay секунд, в течение которого они читают прежнее состояние. Блокировки
+    update_data тоже действуют только внутри процесса. Если базу делят несколько экземпляров
+    бота, нужен write_delay=0 (по умолчанию при BOT_MODE=webhook), и даже тогда одновременные
+    update_data одного пользователя в разных процессах могут затереть друг друга.
+    """
+
+    def __init__(self, url: str = FSM_DATABASE_URL, write_delay: float = FSM_WRITE_DELAY,
+                 ttl: float = FSM_TTL, cleanup_interval: float = FSM_CLEANUP_INTERVAL):
+        self.engine = create_async_engine(url)
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine.sync_engine, 'connect', _set_sqlite_pragmas)
+        self.write_delay = write_delay
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # ключ -> {'state': ..., 'data': ...}: только те поля, что менялись с последней записи
+        self._pending = {}
+        # Пачка, которая пишется прямо сейчас: ее значения тоже должны быть видны чтениям
+        self._flushing = {}
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._cleanup_task = None
+        # Блокировки на ключ, чтобы одновременные update_data не затирали друг друга
+        self._key_locks = weakref.WeakValueDictionary()
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+        register_collector(
+            'bot_fsm_pending_writes', 'FSM records waiting to be written to the database',
+            lambda: len(self._pending) + len(self._flushing)
+        )
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        await self._write(key, 'state', state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        found, value = self._buffered(key, 'state')
+        if found:
+            return value
+        row = await self._read(key)
+        return row.state if row is not None else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        await self._write(key, 'data', _dump(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        found, value = self._buffered(key, 'data')
+        if not found:
+            row = await self._read(key)
+            value = row.data if row is not None else None
+        return json.loads(value) if value else {}
+
+    async def update_data(self, key: StorageKey, data) -> dict:
+        lock = self._key_locks.setdefault(self.key_builder.build(key), asyncio.Lock())
+        async with lock:
+            current = await self.get_data(key)
+            current.update(data)
+            await self.set_data(key, current)
+            return current
+
+    async def close(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        await self.engine.dispose()
+
+    async def flush(self):
+        """Записывает все накопленные изменения одной транзакцией"""
+        await self._ensure_table()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._write_records(self._flushing)
+            except Exception as e:
+                logger.error(f"Ошибка при записи состояний FSM: {e}")
+                # Возвращаем пачку в очередь, не затирая более свежие изменения
+                for key, fields in self._flushing.items():
+                    self._pending[key] = {**fields, **self._pending.get(key, {})}
+            finally:
+                self._flushing = {}
+
+    async def cleanup(self) -> int:
+        """Удаляет устаревшие и пустые записи, возвращает их количество"""
+        await self._ensure_table()
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                delete(fsm_records).where(or_(
+                    fsm_records.c.updated_at < time.time() - self.ttl,
+                    and_(fsm_records.c.state.is_(None), fsm_records.c.data.is_(None)),
+                ))
+            )
+        return result.rowcount
+
+    def _buffered(self, key: StorageKey, field: str):
+        record_key = self.key_builder.build(key)
+        for buffer in (self._pending, self._flushing):
+            fields = buffer.get(record_key)
+            if fields is not None and field in fields:
+                return True, fields[field]
+        return False, None
+
+    async def _read(self, key: StorageKey):
+        await self._ensure_table()
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(fsm_records.c.state, fsm_records.c.data).where(
+                    fsm_records.c.key == self.key_builder.build(key),
+                    fsm_records.c.updated_at >= time.time() - self.ttl,
+                )
+            )
+            return result.first()
+
+    async def _write(self, key: StorageKey, field: str, value):
+        self._pending.setdefault(self.key_builder.build(key), {})[field] = value
+        if self.write_delay <= 0:
+            await self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # Крутимся, пока есть что писать: сюда же попадают изменения, пришедшие во время записи,
+        # и пачки, вернувшиеся в очередь после ошибки
+        while self._pending:
+            await asyncio.sleep(self.write_delay)
+            await self.flush()
+
+    async def _write_records(self, records: dict):
+        now = time.time()
+        # Разговор завершен (state.clear()) — запись можно сразу удалить
+        finished = [key for key, fields in records.items()
+                    if fields.get('state', 0) is None and fields.get('data', 0) is None]
+        # Строки группируются по набору измененных полей: у каждой группы свой upsert
+        groups = {}
+        for key, fields in records.items():
+            if key not in finished:
+                groups.setdefault(tuple(sorted(fields)), []).append({'key': key, **fields, 'updated_at': now})
+        async with self.engine.begin() as conn:
+            if finished:
+                await conn.execute(delete(fsm_records).where(fsm_records.c.key.in_(finished)))
+            for columns, rows in groups.items():
+                insert_ = self._insert()
+                statement = insert_.on_conflict_do_update(
+                    index_elements=[fsm_records.c.key],
+                    set_={column: insert_.excluded[column] for column in (*columns, 'updated_at')},
+                )
+                await conn.execute(statement, rows)
+
+    def _insert(self):
+        if self.engine.dialect.name == 'postgresql':
+            return postgresql.insert(fsm_records)
+        return sqlite.insert(fsm_records)
+
+    async def _ensure_table(self):
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            async with self.engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+            self._ready = True
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.cleanup()
+                if removed:
+                    logger.info(f"Удалено устаревших состояний FSM: {removed}")
+            except Exception as e:
+                logger.error(f"Ошибка при очистке состояний FSM: {e}")
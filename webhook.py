@@ -0,0 +1,93 @@
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from metrics import register_collector
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Публичный адрес, который сообщаем Telegram (например, адрес балансировщика), и локальный адрес сервера
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+# Сколько обновлений один процесс обрабатывает одновременно; остальные ждут своей очереди
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '100'))
+# Сколько одновременных соединений Telegram открывает к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# При нескольких экземплярах за балансировщиком вебхук достаточно зарегистрировать одному из них
+WEBHOOK_REGISTER = os.getenv('WEBHOOK_REGISTER', 'true').lower() == 'true'
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: не дает обрабатывать больше limit обновлений одновременно"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, handler, event, data):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+async def _register_webhook(bot: Bot, dispatcher: Dispatcher):
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH}")
+
+
+async def _health_view(request):
+    return web.Response(text='ok')
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY) -> web.Application:
+    """Собирает aiohttp-приложение, принимающее обновления от Telegram на WEBHOOK_PATH"""
+    limiter = ConcurrencyLimitMiddleware(max_concurrency)
+    dp.update.outer_middleware(limiter)
+    register_collector(
+        'bot_webhook_updates', 'Webhook updates being handled or waiting for a free slot',
+        lambda: {'status="in_flight"': limiter.in_flight, 'status="waiting"': limiter.waiting}
+    )
+
+    app = web.Application()
+    # Telegram получает ответ сразу, а обновление обрабатывается в фоне под ограничением limiter
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    app.router.add_get('/health', _health_view)
+    if WEBHOOK_REGISTER and WEBHOOK_URL:
+        dp.startup.register(_register_webhook)
+    # Запуск и остановка диспетчера (startup/shutdown, закрытие хранилища FSM) вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    """Запускает сервер вебхука и работает до отмены задачи"""
+    app = create_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Вебхук слушает http://{host}:{port}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()